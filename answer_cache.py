@@ -0,0 +1,74 @@
+import threading
+from collections import OrderedDict
+
+import text_processor
+
+# キャッシュに残す質問の数 (超えたら一番長く使われていないものから捨てる)
+DEFAULT_MAX_ENTRIES = 4096
+
+_MISSING = object()
+
+
+class AnswerCache:
+    """
+    質問 → 照合結果 (ルール or None) の LRU キャッシュ。
+    キーは (知識データのハッシュ, 言い換え検索の有無, 正規化した質問) なので、
+    知識データが差し替わると古い答えは使われず、そのうち押し出されて消える。
+    Streamlit のセッション(スレッド)間で共有するのでロックする。
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def lookup(self, matcher, text, similar=False):
+        """text を正規化して matcher.lookup する。同じ質問の2回目からは照合しない。"""
+        key = (matcher.digest, similar, text_processor.normalize_text(text))
+        with self._lock:
+            rule = self._entries.get(key, _MISSING)
+            if rule is not _MISSING:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return rule
+            self.misses += 1
+        rule = matcher.lookup(key[2], similar)
+        with self._lock:
+            self._entries[key] = rule
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return rule
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hit_rate()}
+
+    def print_stats(self):
+        print(f"[回答キャッシュ] {len(self._entries)}件 / ヒット率 {self.hit_rate() * 100:.1f}% "
+              f"(ヒット {self.hits} / 照合 {self.misses})")
+
+
+# プロセスで共有するキャッシュ (app.py の全セッションで共通)
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_cache():
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = AnswerCache()
+        return _shared
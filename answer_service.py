@@ -0,0 +1,376 @@
+"""
+回答サービス: コンパイル済みの知識データを1つのプロセスに常駐させ、ローカルの HTTP/JSON で答える。
+main.py (配信) と app.py (アプリ) は ANSWER_SERVICE_URL を設定すると、自分で照合せずにここへ問い合わせる
+(つながらないときは今までどおり自分で照合する)。
+
+  POST /answer        {"text": 質問, 品物の指定, "similar": false}          → 答え1件
+  POST /answer/batch  {"texts": [質問, ...], 品物の指定, "similar": false}  → {"answers": [答え, ...]}
+  GET  /health                                                → 状態 (品物・回答キャッシュ)
+
+  答え = {"text", "answer", "keyword", "category"}
+  answer は回答のキー (response_map を引く前) のまま返す。wav や表示用の文への変換は呼び出し側の対応表で行う。
+
+  品物の指定は、呼び出し側が自分で使っているものをそのまま送る (サービスの --base-dir とずれないように):
+    "source": 知識データの JSON (絶対パス)
+    "index": インデックスの JSON (絶対パス) + "item": 品物ID (+ "sources": 元の JSON の絶対パスのリスト)
+    "item" だけ: --base-dir のインデックスの品物ID か知識データのファイル名。何もなければ --data の品物。
+  パスは --base-dir の中の .json だけ受け付ける (ほかのファイルは読まない)。
+  main.py から使うときは --base-dir を main.py の BASE_DIR にする。
+  similar を true にすると、キーワードが見つからないとき言い換え(類似検索)でも答える。
+
+使い方:
+  python answer_service.py                              # 127.0.0.1:50507 で待ち受け
+  python answer_service.py --port 50508
+  python answer_service.py --reuse-port                 # 同じポートで複数起動すると OS が振り分ける (Linux)
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import answer_cache
+import data_loader
+import knowledge_store
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 50507
+DEFAULT_DATA = "microwave_data.json"
+DEFAULT_INDEX = knowledge_store.DEFAULT_INDEX_FILE
+# この秒数なにも来ない keep-alive の接続は閉じる (接続1本 = スレッド1本なので、寝ている接続を長く抱えない)
+IDLE_TIMEOUT = 5.0
+# 1回のまとめて回答で受け付ける質問の数 / リクエスト本文の大きさ
+MAX_BATCH = 1000
+MAX_BODY = 1 << 20
+
+# クライアントの待ち時間 (秒)。照合は数ミリ秒で終わるので、これを過ぎたら待たずに自分で照合する
+# (リアクションの考える間 THINKING_DELAY より十分短くしておく)
+DEFAULT_TIMEOUT = 0.3
+# つなぎ直せば通るエラー (使い回した接続がサーバー側で閉じられていた・まだ起動しきっていない)。
+# 時間切れ (socket.timeout) はここに入れない: 送り直してもまた待たされるだけ
+RETRY_ERRORS = (ConnectionError, http.client.RemoteDisconnected)
+
+
+class AnswerServiceError(Exception):
+    """サービスにつながらない・エラーが返ってきた。"""
+
+
+# --- サーバー ---
+
+class KnowledgeBase:
+    """
+    サービスが常駐させる知識データ。呼び出し側が送ってきた知識データ・インデックスのパスか、
+    base_dir のインデックスの品物・知識データファイルを引ける。
+    読み込み・コンパイル・更新の確認は data_loader に任せる (ファイルが変われば次のリクエストから新しいルール)。
+    """
+
+    def __init__(self, base_dir, data_file=DEFAULT_DATA, index_file=DEFAULT_INDEX):
+        self.base_dir = base_dir
+        self._real_base_dir = os.path.realpath(base_dir)
+        self.default_item = data_file
+        self.index_path = os.path.join(base_dir, index_file) if index_file else None
+        self.sources = [os.path.join(base_dir, name) for name in knowledge_store.DEFAULT_SOURCES]
+
+    def _file_matcher(self, name):
+        # ファイル名だけ受け付ける (base_dir の外は読まない)
+        if os.path.basename(name) != name or not name.endswith(".json"):
+            return None
+        return data_loader.get_matcher(os.path.join(self.base_dir, name))
+
+    def _store(self):
+        if not self.index_path:
+            return None
+        return data_loader.get_store(self.index_path, self.sources)
+
+    def matcher(self, item=None, source=None, index=None, sources=()):
+        """
+        品物のコンパイル済み RuleMatcher。知らない品物なら KeyError。
+        source / index / sources は呼び出し側のパス (base_dir の中の .json の絶対パスだけ受け付ける)。
+        """
+        if source is not None:
+            matcher = data_loader.get_matcher(source) if self._allowed(source) else None
+            if matcher is None:
+                raise KeyError(source)
+            return matcher
+        if index is not None:
+            store = None
+            if self._allowed(index) and all(self._allowed(p) for p in sources):
+                store = data_loader.get_store(index, list(sources))
+            if store is None or item not in store:
+                raise KeyError(f"{index}: {item}")
+            return store.matcher(item)
+
+        item = item or self.default_item
+        if not item.endswith(".json"):
+            store = self._store()
+            if store is not None and item in store:
+                return store.matcher(item)
+        matcher = self._file_matcher(item)
+        if matcher is None:
+            raise KeyError(item)
+        return matcher
+
+    def _allowed(self, path):
+        """呼び出し側から送られたパスを読んでよいか (base_dir の中の .json の絶対パスだけ。リンクの先も確かめる)。"""
+        if not isinstance(path, str) or not os.path.isabs(path) or not path.endswith(".json"):
+            return False
+        real = os.path.realpath(path)
+        try:
+            return os.path.commonpath([real, self._real_base_dir]) == self._real_base_dir
+        except ValueError:
+            # ドライブが違う (Windows)
+            return False
+
+    def items(self):
+        store = self._store()
+        return [self.default_item] + (store.item_ids() if store is not None else [])
+
+
+def build_answer(matcher, text, cache, similar=False):
+    """1問に答える。answer は回答のキーのまま (response_map は呼び出し側で引く)。"""
+    rule = cache.lookup(matcher, text, similar)
+    if rule is None:
+        return {"text": text, "answer": None, "keyword": None, "category": None}
+    keyword, answer_key, category = rule
+    return {"text": text, "answer": answer_key, "keyword": keyword, "category": category}
+
+
+class AnswerHandler(BaseHTTPRequestHandler):
+    # ★HTTP/1.1 にして、1つの接続で何問でも続けて受け付ける (keep-alive)
+    protocol_version = "HTTP/1.1"
+    server_version = "RensouAnswer/1.0"
+    timeout = IDLE_TIMEOUT
+    # ヘッダーと本文を別々に書くので、Nagle で返事が 40ms 遅れないようにする
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        if self.path != "/health":
+            self._send(404, {"error": f"not found: {self.path}"})
+            return
+        server = self.server
+        self._send(200, {"status": "ok", "items": server.knowledge.items(),
+                         "answer_cache": server.cache.stats()})
+
+    def do_POST(self):
+        if self.path not in ("/answer", "/answer/batch"):
+            self._send(404, {"error": f"not found: {self.path}"})
+            return
+        request = self._read_json()
+        if request is None:
+            return
+        sources = request.get("sources") or ()
+        if not isinstance(sources, list):
+            sources = [sources]
+        try:
+            matcher = self.server.knowledge.matcher(
+                request.get("item"), request.get("source"), request.get("index"), sources)
+        except KeyError as e:
+            self._send(404, {"error": f"unknown item: {e.args[0]}"})
+            return
+        similar = request.get("similar") is True
+
+        cache = self.server.cache
+        if self.path == "/answer":
+            text = request.get("text")
+            if not isinstance(text, str):
+                self._send(400, {"error": "text がありません"})
+                return
+            self._send(200, build_answer(matcher, text, cache, similar))
+            return
+
+        texts = request.get("texts")
+        if not isinstance(texts, list) or not all(isinstance(t, str) for t in texts):
+            self._send(400, {"error": "texts は文字列のリストにしてください"})
+            return
+        if len(texts) > MAX_BATCH:
+            self._send(413, {"error": f"1回 {MAX_BATCH} 問までです"})
+            return
+        self._send(200, {"answers": [build_answer(matcher, text, cache, similar) for text in texts]})
+
+    def _read_json(self):
+        """本文の JSON (dict)。おかしければエラーを返して None。"""
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            length = -1
+        if length < 0 or length > MAX_BODY:
+            self.close_connection = True
+            self._send(413 if length > MAX_BODY else 400, {"error": "Content-Length が不正です"})
+            return None
+        try:
+            request = json.loads(self.rfile.read(length).decode("utf-8"))
+        except (UnicodeDecodeError, ValueError):
+            request = None
+        if not isinstance(request, dict):
+            self._send(400, {"error": "本文は JSON のオブジェクトにしてください"})
+            return None
+        return request
+
+    def _send(self, status, body):
+        payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        # 1問ごとのアクセスログは出さない (--verbose のときだけ)
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class AnswerServer(ThreadingHTTPServer):
+    """
+    接続ごとにスレッドを1本立てる HTTP サーバー。
+    keep-alive の接続が何本つながっていても、新しい接続が空きを待たされることはない
+    (寝ている接続は IDLE_TIMEOUT で閉じるので、スレッドもたまり続けない)。
+    """
+
+    def __init__(self, address, knowledge, reuse_port=False, verbose=False):
+        self.knowledge = knowledge
+        self.cache = answer_cache.shared_cache()
+        self.reuse_port = reuse_port
+        self.verbose = verbose
+        super().__init__(address, AnswerHandler)
+
+    def server_bind(self):
+        if self.reuse_port and hasattr(socket, "SO_REUSEPORT"):
+            # 同じポートで起動した複数のプロセスに、OS が接続を振り分ける
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, base_dir=BASE_DIR, data_file=DEFAULT_DATA,
+          index_file=DEFAULT_INDEX, reuse_port=False, verbose=False):
+    knowledge = KnowledgeBase(base_dir, data_file, index_file)
+    # 起動時にコンパイル (キャッシュがあれば読むだけ) しておき、最初の質問を待たせない
+    items = knowledge.items()
+    for item in items:
+        try:
+            knowledge.matcher(item)
+        except KeyError:
+            # 呼び出し側が source / index で指定するぶんには困らないので、起動は続ける
+            print(f"★{os.path.join(base_dir, item)} が読めません (item だけの指定では使えません)")
+    server = AnswerServer((host, port), knowledge, reuse_port, verbose)
+    print(f"[回答サービス] http://{host}:{server.server_address[1]} (品物: {', '.join(items)})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+# --- クライアント ---
+
+class AnswerClient:
+    """
+    回答サービスの薄いクライアント。接続はスレッドごとに1本を使い回す (keep-alive)。
+    サーバー側で閉じられていた接続は1回だけつなぎ直す。時間切れ・つながらなければ AnswerServiceError
+    (呼び出し側はすぐ自分で照合する)。
+    """
+
+    def __init__(self, url, timeout=DEFAULT_TIMEOUT):
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme != "http" or not parts.hostname:
+            raise ValueError(f"http://ホスト:ポート の形で指定してください: {url}")
+        self.url = url
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        return conn
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def _request(self, method, path, body=None):
+        payload = None if body is None else json.dumps(body, ensure_ascii=False).encode("utf-8")
+        headers = {"Content-Type": "application/json"} if payload is not None else {}
+        for attempt in range(2):
+            conn = self._connection()
+            try:
+                conn.request(method, path, payload, headers)
+                response = conn.getresponse()
+                data = response.read()
+                break
+            except (OSError, http.client.HTTPException) as e:
+                self.close()
+                # 使い回した接続が閉じられていただけなら、つなぎ直せば通る (答えるだけなので送り直しても平気)
+                if attempt or not isinstance(e, RETRY_ERRORS):
+                    raise AnswerServiceError(f"{self.url} につながりません: {e}") from e
+        try:
+            result = json.loads(data.decode("utf-8"))
+        except (UnicodeDecodeError, ValueError) as e:
+            raise AnswerServiceError(f"回答サービスの返事が読めません: {e}") from e
+        if response.status != 200:
+            raise AnswerServiceError(f"回答サービスのエラー ({response.status}): {result.get('error')}")
+        return result
+
+    def answer(self, text, target=None, similar=False):
+        """target = 品物の指定 ({"source": ...} / {"index": ..., "item": ...}。item_target() で作れる)。"""
+        body = dict(target or {}, text=text, similar=similar)
+        return self._request("POST", "/answer", body)
+
+    def answer_batch(self, texts, target=None, similar=False):
+        body = dict(target or {}, texts=list(texts), similar=similar)
+        return self._request("POST", "/answer/batch", body)["answers"]
+
+    def health(self):
+        return self._request("GET", "/health")
+
+
+def item_target(item, base_dir, index_path=None, store=None, sources=()):
+    """
+    呼び出し側の品物 (インデックスの品物ID か、base_dir の知識データのファイル名) → サービスへ送る品物の指定。
+    パスは絶対パスにして送る (サービスは --base-dir の中のファイルなら、呼び出し側と同じものを読む)。
+    """
+    if store is not None and index_path and item in store:
+        target = {"index": os.path.abspath(index_path), "item": item}
+        if sources:
+            target["sources"] = [os.path.abspath(p) for p in sources]
+        return target
+    return {"source": os.path.abspath(os.path.join(base_dir, item))}
+
+
+# プロセスで共有するクライアント (app.py は再描画のたびにスクリプトを流し直すので、接続をここで持つ)
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def shared_client(url):
+    with _clients_lock:
+        client = _clients.get(url)
+        if client is None:
+            client = _clients[url] = AnswerClient(url)
+        return client
+
+
+def main():
+    parser = argparse.ArgumentParser(description="知識データに答えるローカル HTTP サービス")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--base-dir", default=BASE_DIR, help="知識データ・インデックスのあるフォルダ (この中のファイルだけ読む)")
+    parser.add_argument("--data", default=DEFAULT_DATA, help="item を省略したときの知識データ")
+    parser.add_argument("--index", default=DEFAULT_INDEX, help="全品物のインデックス")
+    parser.add_argument("--reuse-port", action="store_true", help="同じポートで複数起動できるようにする")
+    parser.add_argument("--verbose", action="store_true", help="アクセスログを表示する")
+    args = parser.parse_args()
+    serve(args.host, args.port, args.base_dir, args.data, args.index, args.reuse_port, args.verbose)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,10 @@
 import streamlit as st
-import json
 import os
-import re
+import data_loader
+import chat_history
+import answer_cache
+import answer_service
+import grading
 
 # ==========================================
 # 1. 設定エリア
@@ -10,6 +13,17 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 # ★修正: アプリ専用のJSONファイルを読み込む
 JSON_FILE = os.path.join(BASE_DIR, "microwave_data_app.json")
+
+# ★全品物のインデックスと、アプリで使う品物ID
+# (インデックスがなければ下のJSONから作る。品物がなければ JSON_FILE を直接使う)
+KNOWLEDGE_INDEX_FILE = os.path.join(BASE_DIR, "knowledge_index.json")
+KNOWLEDGE_SOURCES = [os.path.join(BASE_DIR, f) for f in ["microwave_data.json", "microwave_data_app.json", "Fridge_data.json"]]
+ACTIVE_ITEM = "microwave_app"
+# ★回答サービス (python answer_service.py) に照合を任せるときの URL。例: "http://127.0.0.1:50507"
+# (None ならアプリの中で照合する。つながらないときもアプリの中で照合する)
+ANSWER_SERVICE_URL = None
+# ★キーワードが見つからないとき、言い換え(似た質問)でも答えるか
+SIMILAR_MATCH = False
 TEMPLATE_FILE = os.path.join(BASE_DIR, "Questions_template.json")
 
 # 言語別ファイル
@@ -101,19 +115,10 @@ st.markdown("""
 # ==========================================
 # 2. 関数・データ読み込み
 # ==========================================
+# ★JSONの読み込みは data_loader がプロセス単位でキャッシュする
+# (更新日時が変わったときだけ読み直すので、再描画のたびにディスクを読まない)
 def load_json(filename):
-    if os.path.exists(filename):
-        try:
-            with open(filename, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except Exception:
-            return None
-    return None
-
-def normalize_text(text):
-    if not text: return ""
-    text = re.sub(r'[.?,]+', ' ', text)
-    return " ".join(text.split()).lower()
+    return data_loader.load_json(filename)
 
 # 基本データの読み込み
 data = load_json(JSON_FILE)
@@ -123,14 +128,44 @@ if not data or not template:
     st.error("エラー: microwave_data_app.json または questions_template.json が不足しています。")
     st.stop()
 
+# ★ルールのコンパイルもプロセスで1回だけ (全セッション共有)
+store = data_loader.get_store(KNOWLEDGE_INDEX_FILE, KNOWLEDGE_SOURCES, data["response_map"])
+if store is not None and ACTIVE_ITEM in store:
+    matcher = store.matcher(ACTIVE_ITEM)
+    answer_item = ACTIVE_ITEM
+else:
+    matcher = data_loader.get_matcher(JSON_FILE)
+    answer_item = os.path.basename(JSON_FILE)
+# 回答サービスには、アプリが読んでいるのと同じファイル (絶対パス) を指定する
+answer_target = answer_service.item_target(
+    answer_item, BASE_DIR, KNOWLEDGE_INDEX_FILE, store, KNOWLEDGE_SOURCES)
+# ★回答キャッシュもプロセスで1つ (全セッション共有。知識データが変わればキーも変わる)
+answers = answer_cache.shared_cache()
+
+def ask(text):
+    """(ルール, response_map を引いた回答) を返す。見つからなければ (None, None)。"""
+    if ANSWER_SERVICE_URL:
+        try:
+            result = answer_service.shared_client(ANSWER_SERVICE_URL).answer(text, answer_target, SIMILAR_MATCH)
+            if result["answer"] is None:
+                return None, None
+            # 返ってくるのは回答のキーだけ。表示用の文はアプリの response_map で引く (自分で照合したときと同じ)
+            rule = (result["keyword"], result["answer"], result["category"])
+            return rule, matcher.response_map.get(rule[1], rule[1])
+        except answer_service.AnswerServiceError:
+            pass
+    rule = answers.lookup(matcher, text, SIMILAR_MATCH)
+    if rule is None:
+        return None, None
+    return rule, matcher.response_map.get(rule[1], rule[1])
+
 
 # ==========================================
 # 3. セッションステート初期化
 # ==========================================
-if "chat_history" not in st.session_state:
-    st.session_state.chat_history = [] 
-if "found_clues" not in st.session_state:
-    st.session_state.found_clues = []
+# ★履歴は直近 HISTORY_LIMIT 件だけ保持し、吹き出しのHTMLと手がかりもこの中で管理する
+if "chat" not in st.session_state:
+    st.session_state.chat = chat_history.ChatHistory()
 
 # 初級用
 if "training_cat_index" not in st.session_state:
@@ -139,8 +174,11 @@ if "mistake_count" not in st.session_state:
     st.session_state.mistake_count = 0
 if "last_feedback" not in st.session_state:
     st.session_state.last_feedback = ""
-if "completed_phrases" not in st.session_state:
-    st.session_state.completed_phrases = set()
+if "last_missed" not in st.session_state:
+    st.session_state.last_missed = []
+# ★クリアした問題は「カテゴリ → 問題IDの集合」で持つ (判定・やり直しが問題数によらず一定時間)
+if "completed_tasks" not in st.session_state:
+    st.session_state.completed_tasks = {}
 if "current_category" not in st.session_state:
     st.session_state.current_category = ""
 if "current_lang" not in st.session_state:
@@ -176,13 +214,13 @@ with st.sidebar:
     
     st.markdown("---")
     if st.button("Reset All"):
-        st.session_state.chat_history = []
-        st.session_state.found_clues = []
-        st.session_state.completed_phrases = set()
+        st.session_state.chat.clear()
+        st.session_state.completed_tasks = {}
         st.session_state.training_cat_index = 0
         st.session_state.mistake_count = 0
         st.session_state.last_feedback = ""
         st.rerun()
+    st.caption(f"Answer cache: {len(answers)} / hit rate {answers.hit_rate() * 100:.0f}%")
 
 st.title(f"🔒 連想 Gamers ({lang_select})")
 
@@ -237,21 +275,22 @@ if password != SECRET_PASSWORD_VAL:
 if mode == "🔰 初級者 (Training)":
     
     if lang_select == "🇺🇸 English":
-        training_data = load_json(TRAINING_FILE_EN)
+        training_index = data_loader.get_training_index(TRAINING_FILE_EN)
     else:
-        training_data = load_json(TRAINING_FILE_ES)
+        training_index = data_loader.get_training_index(TRAINING_FILE_ES)
 
-    if not training_data:
+    if not training_index or not training_index["categories"]:
         st.error(f"エラー: {lang_select} 用のトレーニングデータが見つかりません。")
         st.stop()
     
-    categories = sorted(list(set(item["category"] for item in training_data)))
+    # カテゴリ一覧とカテゴリ別の問題リストは読み込み時に作成済み
+    categories = training_index["categories"]
     
     # カテゴリ初期化
     if st.session_state.current_category not in categories:
           st.session_state.current_category = categories[0]
           
-    selected_cat = st.selectbox("カテゴリー選択", categories, index=categories.index(st.session_state.current_category))
+    selected_cat = st.selectbox("カテゴリー選択", categories, index=training_index["category_positions"][st.session_state.current_category])
 
     if selected_cat != st.session_state.current_category:
         st.session_state.current_category = selected_cat
@@ -260,7 +299,10 @@ if mode == "🔰 初級者 (Training)":
         st.session_state.last_feedback = ""
         st.rerun()
 
-    current_tasks = [t for t in training_data if t["category"] == selected_cat]
+    current_tasks = training_index["tasks_by_category"][selected_cat]
+    # 進み具合はファイル(言語)とカテゴリの組ごと
+    progress_key = f'{training_index["name"]}/{selected_cat}'
+    completed = st.session_state.completed_tasks.get(progress_key, set())
     
     if st.session_state.training_cat_index < len(current_tasks):
         target_task = current_tasks[st.session_state.training_cat_index]
@@ -278,8 +320,12 @@ if mode == "🔰 初級者 (Training)":
             st.markdown('<div class="feedback-msg feedback-good">Good! 👍</div>', unsafe_allow_html=True)
         elif fb == "Retry":
             st.markdown('<div class="feedback-msg feedback-retry">もう一回！ (Try again) 💦</div>', unsafe_allow_html=True)
+            if st.session_state.last_missed:
+                st.caption("Missed: " + " / ".join(st.session_state.last_missed))
         elif fb == "Almost":
             st.markdown('<div class="feedback-msg feedback-retry">もうちょいだ！ (Almost) 🔥</div>', unsafe_allow_html=True)
+            if st.session_state.last_missed:
+                st.caption("Missed: " + " / ".join(st.session_state.last_missed))
         elif fb == "Skip":
             # スキップ時の厳しいメッセージ
             st.markdown("""
@@ -304,10 +350,7 @@ if mode == "🔰 初級者 (Training)":
         
         target_task = None
         if st.button("Retry this Category"):
-            for t in current_tasks:
-                kw = t.get("keyword")
-                if kw in st.session_state.completed_phrases:
-                    st.session_state.completed_phrases.remove(kw)
+            st.session_state.completed_tasks.pop(progress_key, None)
             st.session_state.training_cat_index = 0
             st.session_state.mistake_count = 0
             st.session_state.last_feedback = ""
@@ -319,22 +362,24 @@ if mode == "🔰 初級者 (Training)":
             submit_button = st.form_submit_button(label='送信する')
 
         if submit_button and user_input:
-            clean_input = normalize_text(user_input)
             t_kw = target_task.get("keyword", "")
             t_q = target_task.get("question", "")
             
-            # 判定: キーワードが含まれているか OR 全文一致
-            if t_kw in clean_input or normalize_text(t_q) in clean_input:
+            # 判定: キーワードが言えたか OR 全文が言えたか (単語単位で対応づけて、言えなかった単語も出す)
+            result = grading.grade(user_input, t_q, t_kw)
+            st.session_state.last_missed = result.missed
+            if result.passed:
                 st.session_state.last_feedback = "Good!"
-                st.session_state.completed_phrases.add(t_kw)
+                st.session_state.completed_tasks.setdefault(progress_key, set()).add(target_task["id"])
                 st.session_state.training_cat_index += 1
                 st.session_state.mistake_count = 0
             else:
                 st.session_state.mistake_count += 1
                 count = st.session_state.mistake_count
-                if count == 1: st.session_state.last_feedback = "Retry"
-                elif count == 2: st.session_state.last_feedback = "Almost"
-                elif count >= 3:
+                # 惜しいかどうかは点数で決める (1回目でも惜しければ "Almost")
+                if count < 3:
+                    st.session_state.last_feedback = "Almost" if result.verdict == grading.VERDICT_ALMOST else "Retry"
+                else:
                     st.session_state.last_feedback = "Skip"
                     st.session_state.training_cat_index += 1
                     st.session_state.mistake_count = 0
@@ -342,13 +387,12 @@ if mode == "🔰 初級者 (Training)":
 
     st.markdown("---")
     st.markdown("**List Progress:**")
-    for t in current_tasks:
-        kw = t["keyword"]
+    for i, t in enumerate(current_tasks):
         q = t["question"]
-        if kw in st.session_state.completed_phrases:
+        if t["id"] in completed:
             st.markdown(f"✅ **{q}**")
         else:
-            if t == target_task:
+            if i == st.session_state.training_cat_index:
                 st.markdown(f"👉 **{q}**")
             else:
                 st.markdown(f"⬜ {q}")
@@ -361,97 +405,73 @@ else:
     st.caption("ヒントはありません。自分の言葉で質問して、正解を見つけよう！")
     
     # チャット履歴
-    chat_html = '<div class="chat-scroll-area">'
-    for chat in reversed(st.session_state.chat_history):
-        if chat["role"] == "user":
-            chat_html += f'<div class="user-bubble">{chat["content"]}</div>'
-        elif chat["role"] == "assistant":
-            content = chat["content"]
-            status = chat.get("status")
-            display_text = f"🟢 {content}" if status == "success" else (f"🔴 {content}" if status == "error" else f"🟡 {content}")
-            chat_html += f'<div class="bot-bubble-container"><div class="bot-avatar">🤖</div><div class="bot-bubble">{display_text}</div></div>'
-    chat_html += '</div>'
-    st.markdown(chat_html, unsafe_allow_html=True)
+    # ★吹き出しはメッセージ追加時に作ってあるので、ここではつなげるだけ
+    chat = st.session_state.chat
+    st.markdown(chat.html(), unsafe_allow_html=True)
+    if chat.archived:
+        st.caption(f"古いメッセージ {chat.archived} 件は省略しています")
 
     with st.form(key='gamer_form', clear_on_submit=True):
         user_input = st.text_input("Your Question:", placeholder="Any language is OK!")
         submit_button = st.form_submit_button(label='Send')
 
     if submit_button and user_input:
-        clean_input = normalize_text(user_input)
-        st.session_state.chat_history.append({"role": "user", "content": user_input})
+        chat.append("user", user_input)
         
         found_key = None
         
-        # ★修正ポイント: 全ルールを取得して「文字数が長い順」に並べ替える
-        # これにより "bigger than your hand" (短いYES) より "bigger than your hand... right" (長いNO) が先にチェックされる
-        all_rules = []
-        for category, rules in data["rules"].items():
-            for keyword, answer_key in rules.items():
-                all_rules.append((keyword, answer_key))
-        
-        # キーワードの文字数で降順ソート (長い順)
-        all_rules.sort(key=lambda x: len(x[0]), reverse=True)
-
-        for keyword, answer_key in all_rules:
-            if keyword in clean_input:
-                found_key = keyword
-                
-                raw_answer = data["response_map"].get(answer_key, answer_key)
-                
-                # リスト形式の場合の安全策
-                if isinstance(raw_answer, list):
-                    raw_answer = raw_answer[0]
-                
-                # 念のため大文字化
-                raw_answer = str(raw_answer).upper()
-                
-                display_map = {
-                    "YES": "Yes! (イエス)", 
-                    "NO": "No. (ノー)",
-                    "SI_YES": "Si!(Yes)",
-                    "STRONG_YES": "That's a Good Question! イエス！",
-                    "YES_OF_COURSE": "もちろん！", 
-                    "PARTIAL_YES": "部分的にはイエス！",
-                    "BIG_PARTIAL_YES": "大部分はイエス！",
-                    "CORRECT": "大正解！おめでとう！！！", 
-                    "USUALLY_YES": "Usually Yes (たいていそう)",
-                    "DEPENDS": "It depends (場合による)",
-                    "SOME_PEOPLE_USE": "Some people use it (使う人もいる)",
-                    "SOME_PEOPLE_CAN": "Some people can find it(見つけられる人もいる)",
-                    "SOME_ARE_YES": "Some are Yes (そういうのもある)",
-                    "SOME_ARE_YES_1": "Some are Yes(気に...)",
-                    "SOME_ARE_YES_2": "Some are Yes(気にす...)",
-                    "SOME_ARE_YES_3": "Some are Yes(気にするな！)", 
-                    "CLOSE": "Close! (惜しい！)"
-                }
-                display_answer = display_map.get(raw_answer, raw_answer)
-                
-                # ポジティブ判定ロジック
-                is_positive = any(k in raw_answer for k in ["YES", "CORRECT", "PARTIAL", "USUALLY", "SOME"])
-                status = "success" if is_positive else "error"
-                
-                st.session_state.chat_history.append({
-                    "role": "assistant", 
-                    "content": f"{display_answer}", 
-                    "status": status
-                })
-                
-                if is_positive and found_key not in st.session_state.found_clues:
-                    st.session_state.found_clues.append(found_key)
-                break 
+        # ★修正ポイント: ルールは起動時にコンパイル済みのオートマトンで「最長一致」を1回の走査で探す
+        # これにより "bigger than your hand" (短いYES) より "bigger than your hand... right" (長いNO) が優先される
+        # 見つからなければ、つづり間違いを直してもう一度探す (あいまい一致)
+        # 他の人が同じ質問をしていれば、回答キャッシュから返す (正規化もこの中で行う)
+        # 回答サービスを使うときは、照合はサービス側で行う
+        rule, raw_answer = ask(user_input)
+
+        if rule:
+            keyword, answer_key, category = rule
+            found_key = keyword
+            
+            # リスト形式の場合の安全策
+            if isinstance(raw_answer, list):
+                raw_answer = raw_answer[0]
+            
+            # 念のため大文字化
+            raw_answer = str(raw_answer).upper()
+            
+            display_map = {
+                "YES": "Yes! (イエス)", 
+                "NO": "No. (ノー)",
+                "SI_YES": "Si!(Yes)",
+                "STRONG_YES": "That's a Good Question! イエス！",
+                "YES_OF_COURSE": "もちろん！", 
+                "PARTIAL_YES": "部分的にはイエス！",
+                "BIG_PARTIAL_YES": "大部分はイエス！",
+                "CORRECT": "大正解！おめでとう！！！", 
+                "USUALLY_YES": "Usually Yes (たいていそう)",
+                "DEPENDS": "It depends (場合による)",
+                "SOME_PEOPLE_USE": "Some people use it (使う人もいる)",
+                "SOME_PEOPLE_CAN": "Some people can find it(見つけられる人もいる)",
+                "SOME_ARE_YES": "Some are Yes (そういうのもある)",
+                "SOME_ARE_YES_1": "Some are Yes(気に...)",
+                "SOME_ARE_YES_2": "Some are Yes(気にす...)",
+                "SOME_ARE_YES_3": "Some are Yes(気にするな！)", 
+                "CLOSE": "Close! (惜しい！)"
+            }
+            display_answer = display_map.get(raw_answer, raw_answer)
+            
+            # ポジティブ判定ロジック
+            is_positive = any(k in raw_answer for k in ["YES", "CORRECT", "PARTIAL", "USUALLY", "SOME"])
+            status = "success" if is_positive else "error"
+            
+            chat.append("assistant", f"{display_answer}", status)
+            
+            if is_positive:
+                chat.add_clue(found_key)
         
         if not found_key:
-            st.session_state.chat_history.append({
-                "role": "assistant", 
-                "content": "🤔 Sorry, I don't understand.", 
-                "status": "warning"
-            })
+            chat.append("assistant", "🤔 Sorry, I don't understand.", "warning")
         st.rerun()
 
-    if st.session_state.found_clues:
+    if chat.clues:
         st.markdown('<div class="clue-box">📝 <b>Found Clues (判明した手がかり):</b><br>', unsafe_allow_html=True)
-        clue_html = ""
-        for clue in st.session_state.found_clues:
-            clue_html += f'<span class="clue-item">{clue}</span>'
-        st.markdown(clue_html + '</div>', unsafe_allow_html=True)
\ No newline at end of file
+        st.markdown(chat.clue_html() + '</div>', unsafe_allow_html=True)
\ No newline at end of file
@@ -0,0 +1,129 @@
+import json
+import os
+import sys
+import wave
+
+import hotkeys
+import rule_engine
+
+AUDIO_EXTENSIONS = (".wav",)
+
+
+def read_duration(path):
+    """WAV のヘッダーから再生時間(秒)を読む。読めなければ None。"""
+    try:
+        with wave.open(path, "rb") as w:
+            rate = w.getframerate()
+            return w.getnframes() / rate if rate else None
+    except (OSError, EOFError, wave.Error):
+        return None
+
+
+class AudioManifest:
+    """
+    audio/ フォルダの音声素材の一覧。起動時に1回だけ走査し、
+    ファイル名 → 絶対パス・再生時間 を引けるようにしておく (回答のたびにパスを組み立てない)。
+    """
+
+    def __init__(self, audio_dir):
+        self.audio_dir = os.path.abspath(audio_dir)
+        # ファイル名 -> 再生時間(秒) (ヘッダーが読めなければ None)
+        self.durations = {}
+        self._paths = {}
+        # 再生時に「ファイルがない」と表示済みの名前 (同じ警告をくり返さない)
+        self._warned = set()
+        self.scan()
+
+    def scan(self):
+        self.durations = {}
+        self._paths = {}
+        try:
+            names = sorted(os.listdir(self.audio_dir))
+        except OSError as e:
+            print(f"★音声フォルダが読めません({self.audio_dir}): {e}")
+            return
+        for name in names:
+            if not name.lower().endswith(AUDIO_EXTENSIONS):
+                continue
+            path = os.path.join(self.audio_dir, name)
+            self._paths[name] = path
+            self.durations[name] = read_duration(path)
+
+    def __contains__(self, name):
+        return name in self.durations
+
+    def __len__(self):
+        return len(self.durations)
+
+    def path(self, name):
+        """OBS に渡す絶対パス。ファイルがなくても同じ形のパスを返す (警告は resolve・report で出す)。"""
+        path = self._paths.get(name)
+        if path is None:
+            path = self._paths[name] = os.path.normpath(os.path.join(self.audio_dir, name))
+        return path
+
+    def resolve(self, name):
+        """再生するときのパス。ファイルがなければ (名前ごとに1回だけ) 警告を出す。"""
+        if name not in self.durations and name not in self._warned:
+            self._warned.add(name)
+            print(f"★音声ファイルがありません: {name}")
+        return self.path(name)
+
+    def duration(self, name, default=None):
+        value = self.durations.get(name)
+        return default if value is None else value
+
+    def check(self, targets):
+        """
+        targets (使う予定の wav 名の集まり) と、フォルダの中身を比べる。
+        (足りないファイル, 使われていないファイル) をそれぞれ並べ替えて返す。
+        """
+        targets = set(targets)
+        missing = sorted(name for name in targets if name not in self.durations)
+        unused = sorted(name for name in self.durations if name not in targets)
+        return missing, unused
+
+    def report(self, targets):
+        """起動時の点検結果を表示する。足りないファイルがなければ True。"""
+        missing, unused = self.check(targets)
+        total = sum(d for d in self.durations.values() if d)
+        print(f"[音声素材] {len(self.durations)}ファイル (合計 {total:.1f}秒) / {self.audio_dir}")
+        for name in missing:
+            print(f"  ★見つからない音声: {name}")
+        for name in unused:
+            print(f"  (未使用: {name})")
+        broken = [name for name, d in self.durations.items() if d is None]
+        for name in broken:
+            print(f"  ★再生時間が読めない音声: {name}")
+        return not missing
+
+
+def wav_targets(response_maps, *wav_lists):
+    """response_map の値と、そのほかの wav 名のリストから、使う予定の wav 名の集合を作る。"""
+    targets = set()
+    for response_map in response_maps:
+        for value in response_map.values():
+            if isinstance(value, str) and value.lower().endswith(AUDIO_EXTENSIONS):
+                targets.add(value)
+    for wavs in wav_lists:
+        targets.update(wavs)
+    return targets
+
+
+def project_targets(response_maps):
+    """知識データの response_map に、ホットキーの wav と何にも一致しないときの wav を足した集合。"""
+    return wav_targets(response_maps, hotkeys.wavs(), [rule_engine.DEFAULT_WAV])
+
+
+if __name__ == "__main__":
+    # 使い方: python audio_manifest.py [知識データ.json ...]
+    # audio/ の各ファイルの再生時間と、知識データから参照されているのに無いファイルを表示する
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    manifest = AudioManifest(os.path.join(base_dir, "audio"))
+    for name, seconds in manifest.durations.items():
+        print(f"  {name:<32} {'?' if seconds is None else f'{seconds:6.2f}秒'}")
+    maps = []
+    for filename in sys.argv[1:] or [os.path.join(base_dir, "microwave_data.json")]:
+        with open(filename, "r", encoding="utf-8") as f:
+            maps.append(json.load(f).get("response_map", {}))
+    sys.exit(0 if manifest.report(project_targets(maps)) else 1)
@@ -0,0 +1,165 @@
+"""
+知識データに大量の質問をまとめて答えさせる (チャットログでの回帰テスト用)。
+
+使い方:
+  python batch_answer.py questions.txt                      # 1行1質問 → 1行1JSON で答えを出力
+  type chatlog.jsonl | python batch_answer.py -             # 標準入力から ({"text": ...} の JSONL も可)
+  python batch_answer.py log.jsonl --data Fridge_data.json --format tsv
+  python batch_answer.py huge.txt --workers 4               # プロセスを分けて並列に答える
+
+プログラムから使うとき:
+  matcher = batch_answer.load_matcher("microwave_data.json")
+  for row in batch_answer.answer_stream(batch_answer.read_questions(f), matcher): ...
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import knowledge_cache
+import knowledge_store
+import rule_engine
+import text_processor
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DATA = os.path.join(BASE_DIR, "microwave_data.json")
+DEFAULT_WAV = rule_engine.DEFAULT_WAV
+
+# 並列で答えるとき、1回にワーカーへ渡す質問の数
+CHUNK_SIZE = 2000
+
+
+def load_matcher(path, fallback_path=DEFAULT_DATA):
+    """
+    知識データ (rules 形式でも質問→回答の形式でも可) をコンパイルした RuleMatcher。
+    コンパイル結果は knowledge_cache に残すので、並列のワーカーは読み込むだけで済む。
+    質問文形式 (response_map なし) のときは、main.py と同じく fallback_path の品物の対応表を借りる。
+    """
+    cache = knowledge_cache.ArtifactCache()
+    matcher = knowledge_store.load_file(path, cache)
+    if not matcher.response_map and fallback_path and os.path.abspath(fallback_path) != os.path.abspath(path):
+        matcher.response_map = knowledge_store.load_file(fallback_path, cache).response_map
+    return matcher
+
+
+def read_questions(lines):
+    """
+    1行1質問のテキストか JSONL ({"text": 質問, ...}) を読み、質問の dict を1つずつ返す。
+    JSONL のほかの項目 (id, user など) はそのまま答えに引き継ぐ。
+    text が文字列でない行は、行番号を標準エラーに出して飛ばす (1行のせいで全体を止めない)。
+    """
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith("{"):
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            if isinstance(row, dict) and "text" in row:
+                if isinstance(row["text"], str):
+                    yield row
+                else:
+                    print(f"★{number}行目: text が文字列ではないので飛ばします: {line[:80]}", file=sys.stderr)
+                continue
+        yield {"text": line}
+
+
+def answer_one(matcher, question, similar=False):
+    """1問に答える。{"text", "answer", "keyword", "category", "wav"} (+ 元の項目)。"""
+    rule = matcher.lookup(text_processor.normalize_text(question["text"]), similar)
+    if rule is None:
+        return {**question, "answer": None, "keyword": None, "category": None, "wav": DEFAULT_WAV}
+    keyword, answer_key, category = rule
+    return {**question, "answer": answer_key, "keyword": keyword, "category": category,
+            "wav": rule_engine.resolve_wav(matcher.response_map, answer_key, DEFAULT_WAV)}
+
+
+def answer_stream(questions, matcher, similar=False):
+    """質問を1つずつ答えて返す (入力を全部読み込まずに流す)。similar=True で言い換えでも答える。"""
+    for question in questions:
+        yield answer_one(matcher, question, similar)
+
+
+# --- プロセスプールで並列に答える ---
+
+_worker_matcher = None
+_worker_similar = False
+
+
+def _init_worker(data_path, similar):
+    global _worker_matcher, _worker_similar
+    _worker_matcher = load_matcher(data_path)
+    _worker_similar = similar
+
+
+def _answer_chunk(chunk):
+    return [answer_one(_worker_matcher, question, _worker_similar) for question in chunk]
+
+
+def answer_parallel(questions, data_path, workers=None, chunk_size=CHUNK_SIZE, similar=False):
+    """
+    answer_stream と同じ答えを、入力の順番のまま返す。
+    知識データは先にこのプロセスで1回コンパイルしてキャッシュに残し、各ワーカーは起動時にそれを読み込む。
+    質問は chunk_size 件ずつ渡す。先読みはワーカー数の2倍のかたまりまでにして、巨大な入力でもメモリを使いすぎないようにする。
+    """
+    questions = iter(questions)
+    load_matcher(data_path)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(data_path, similar)) as executor:
+        ahead = 2 * (workers or os.cpu_count() or 1)
+        pending = []
+        while True:
+            while len(pending) < ahead:
+                chunk = list(itertools.islice(questions, chunk_size))
+                if not chunk:
+                    break
+                pending.append(executor.submit(_answer_chunk, chunk))
+            if not pending:
+                return
+            yield from pending.pop(0).result()
+
+
+def format_row(row, fmt):
+    if fmt == "tsv":
+        fields = [row["text"], row["answer"], row["keyword"], row["category"], row["wav"]]
+        return "\t".join("" if v is None else str(v).replace("\t", " ") for v in fields)
+    return json.dumps(row, ensure_ascii=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="質問をまとめて知識データに答えさせる")
+    parser.add_argument("input", nargs="?", default="-", help="質問のファイル (.txt / .jsonl)。- で標準入力")
+    parser.add_argument("--data", default=DEFAULT_DATA, help="知識データの JSON")
+    parser.add_argument("--format", choices=["jsonl", "tsv"], default="jsonl", help="出力の形式")
+    parser.add_argument("--workers", type=int, default=0, help="並列に答えるプロセス数 (0 で並列にしない)")
+    parser.add_argument("--similar", action="store_true", help="キーワードがなければ言い換え(類似検索)でも答える")
+    args = parser.parse_args()
+
+    if args.input == "-":
+        stream = sys.stdin
+    else:
+        stream = open(args.input, "r", encoding="utf-8")
+    try:
+        questions = read_questions(stream)
+        if args.workers > 0:
+            rows = answer_parallel(questions, args.data, args.workers, similar=args.similar)
+        else:
+            rows = answer_stream(questions, load_matcher(args.data), args.similar)
+        answered = matched = 0
+        for row in rows:
+            answered += 1
+            if row["answer"] is not None:
+                matched += 1
+            print(format_row(row, args.format))
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+    print(f"{answered}問中 {matched}問に回答しました", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
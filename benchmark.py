@@ -0,0 +1,466 @@
+"""
+照合処理と回答パイプラインのオフライン・ベンチマーク (配信に出る前の確認用)。
+
+使い方:
+  python benchmark.py                          # 実データ + 合成データ(1万キーワード)で照合を計測
+  python benchmark.py --corpus latency_log.jsonl  # 配信で記録した質問を流し直す
+  python benchmark.py --replay                 # main.main を一時フォルダで動かして通しで計測
+  python benchmark.py --similar-check          # 言い換え検索のしきい値を paraphrase_samples.jsonl で点検
+  python benchmark.py --realistic 30000        # 本物の質問の語彙で作った3万件で言い換え検索を計測 (0で省略)
+  python benchmark.py --intake-check           # 質問受付 (重複・回数制限・あふれ・チャットの間隔) の動作確認
+
+コーパスは1行1JSON ({"text": 質問, "expected": 回答キー or null}) か、1行1質問のテキスト。
+latency_log.jsonl をそのまま渡すと、当時の wav を正解として比べる。
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import shutil
+import string
+import sys
+import tempfile
+import threading
+import time
+
+import answer_cache
+import knowledge_store
+import paraphrase_index
+import question_intake
+import reaction_pipeline
+import rule_engine
+import text_processor
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CORPUS = os.path.join(BASE_DIR, "bench_corpus.jsonl")
+DEFAULT_DATA = os.path.join(BASE_DIR, "microwave_data.json")
+# 言い換え検索の点検用 ({"data": 知識データ, "text": 質問, "expected": 答えるべきキーワード or null})
+SIMILAR_SAMPLES = os.path.join(BASE_DIR, "paraphrase_samples.jsonl")
+
+# 正解が書かれていない質問 (null は「何にも一致しないのが正解」の意味なので区別する)
+UNKNOWN = object()
+
+
+def load_corpus(path):
+    """[(質問, 正解)] を返す。正解が書かれていないものは UNKNOWN。"""
+    corpus = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if not line.startswith("{"):
+                corpus.append((line, UNKNOWN))
+                continue
+            row = json.loads(line)
+            if "expected" in row:
+                expected = row["expected"]
+            elif "info" in row:
+                # latency_log.jsonl の行 (当時再生した wav)
+                expected = row["info"].get("wav", UNKNOWN)
+            else:
+                expected = UNKNOWN
+            corpus.append((row["text"], expected))
+    return corpus
+
+
+def synthetic_data(data, n_keywords, seed=0):
+    """実データに、ありえない単語の組み合わせのキーワードを足して n_keywords 件以上にする。"""
+    rng = random.Random(seed)
+    rules = {cat: dict(items) for cat, items in data["rules"].items()}
+    answers = sorted(data.get("response_map", {})) or ["yes", "no"]
+    extra = {}
+    total = sum(len(items) for items in rules.values())
+    while total + len(extra) < n_keywords:
+        words = ["".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 9)))
+                 for _ in range(rng.randint(1, 3))]
+        extra.setdefault(" ".join(words), rng.choice(answers))
+    rules["category_synthetic"] = extra
+    return {**data, "rules": rules}
+
+
+# 本物の質問らしいフレーズの書き出し (realistic_data)
+QUESTION_OPENERS = [
+    "is it", "is it a", "is it made of", "is it bigger than a", "is it smaller than a",
+    "can you find it in the", "can you find it at the", "does it have", "does it use",
+    "do you use it to", "do you use it in the", "can you", "is there a", "does it make",
+]
+
+
+def realistic_data(data, n_phrases, seed=0):
+    """
+    実データ・コーパス・言い換えサンプルの単語で、本物の質問らしいキーワードを n_phrases 件作る。
+    synthetic_data のでたらめな単語と違い、実際の質問と n-gram を多く共有するので
+    言い換え検索 (転置リストが長くなる) の計測に使う。
+    """
+    texts = [key for items in data["rules"].values() for key in items]
+    for path in (DEFAULT_CORPUS, SIMILAR_SAMPLES):
+        with open(path, "r", encoding="utf-8") as f:
+            texts += [json.loads(line)["text"] for line in f if line.strip()]
+    vocab = sorted({w for t in texts for w in re.findall(r"[a-z]+", t.lower()) if len(w) >= 3})
+    rng = random.Random(seed)
+    answers = sorted(data.get("response_map", {})) or ["yes", "no"]
+    phrases = {}
+    while len(phrases) < n_phrases:
+        words = [rng.choice(vocab) for _ in range(rng.randint(1, 3))]
+        phrases.setdefault(" ".join([rng.choice(QUESTION_OPENERS)] + words), rng.choice(answers))
+    return {**data, "rules": {"category_realistic": phrases}}
+
+
+def run_similar(corpus, data, n_phrases):
+    """言い換え検索だけを、しきい値で候補を絞る場合と全件を数える場合で比べる (答えが同じかも確かめる)。"""
+    matcher = rule_engine.compile_rules(realistic_data(data, n_phrases))
+    index = matcher._similar
+    texts = [(main_normalize(text), UNKNOWN) for text, _ in corpus]
+    threshold = paraphrase_index.DEFAULT_THRESHOLD
+    print(f"\n=== 言い換え検索 (本物の語彙): フレーズ {len(index)}件 / 質問 {len(texts)}件 ===")
+    bench(f"similar (しきい値 {threshold})", lambda t: index.lookup(t, threshold), texts, {})
+    bench("similar (全件を数える)", lambda t: index.search(t), texts, {})
+    differ = 0
+    for text, _ in texts:
+        score, doc_id = index.search(text)
+        full = index.values[doc_id] if doc_id != -1 and score >= threshold else None
+        if index.lookup(text, threshold) != full:
+            differ += 1
+    print(f"  全件を数えた場合と答えが違った質問: {differ}件")
+
+
+# --- 比較用: 以前の実装 (毎回ルールを並べ替えて部分一致を探す) ---
+
+def legacy_main_find(text, data):
+    text = text.lower()
+    text = re.sub(r'[^\w\s]', ' ', text)
+    text = re.sub(r'\s+', ' ', text).strip()
+    rules = []
+    for cat, items in data.get("rules", {}).items():
+        for k, v in items.items():
+            rules.append((k.lower(), v, cat))
+    rules.sort(key=lambda x: len(x[0]), reverse=True)
+    for k, v, cat in rules:
+        if k in text:
+            return v
+    return None
+
+
+def legacy_app_find(text, data):
+    text = re.sub(r'[.?,]+', ' ', text)
+    text = " ".join(text.split()).lower()
+    all_rules = []
+    for category, rules in data["rules"].items():
+        for keyword, answer_key in rules.items():
+            all_rules.append((keyword, answer_key))
+    all_rules.sort(key=lambda x: len(x[0]), reverse=True)
+    for keyword, answer_key in all_rules:
+        if keyword in text:
+            return answer_key
+    return None
+
+
+def main_normalize(text):
+    # main.find_response / app.py と同じ正規化
+    return text_processor.normalize_text(text)
+
+
+def matchers_for(data):
+    """(名前, 関数) のリスト。関数は質問を受け取り回答キー(なければ None)を返す。"""
+    matcher = rule_engine.compile_rules(data)
+
+    def exact(text):
+        rule = matcher.match(main_normalize(text))
+        return rule[1] if rule else None
+
+    def fuzzy(text):
+        text = main_normalize(text)
+        rule = matcher.match(text) or matcher.match_fuzzy(text)
+        return rule[1] if rule else None
+
+    def lookup(text):
+        rule = matcher.lookup(main_normalize(text), similar=True)
+        return rule[1] if rule else None
+
+    cache = answer_cache.AnswerCache()
+
+    def cached(text):
+        rule = cache.lookup(matcher, text)
+        return rule[1] if rule else None
+
+    return [
+        ("legacy main.find_response", lambda t: legacy_main_find(t, data)),
+        ("legacy app.py loop", lambda t: legacy_app_find(t, data)),
+        ("rule_engine (exact)", exact),
+        ("rule_engine (exact+fuzzy)", fuzzy),
+        ("rule_engine (+similar)", lookup),
+        ("answer_cache", cached),
+        ("text_processor.normalize", lambda t: text_processor.normalize_text(t) and None),
+    ]
+
+
+def _percentile(ordered, p):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+def bench(name, func, corpus, response_map, min_seconds=0.3):
+    """corpus を min_seconds 以上くり返し流し、1回ごとの時間と正解率を測る。"""
+    times = []
+    started = time.perf_counter()
+    correct = checked = 0
+    rounds = 0
+    while rounds == 0 or time.perf_counter() - started < min_seconds:
+        for text, expected in corpus:
+            t0 = time.perf_counter_ns()
+            answer = func(text)
+            times.append(time.perf_counter_ns() - t0)
+            if rounds == 0 and expected is not UNKNOWN and "normalize" not in name:
+                checked += 1
+                # 正解は回答キーでも wav 名でもよい (何にも一致しなければ DEFAULT の none.wav 扱い)
+                wav = response_map.get(answer, "none.wav") if answer is not None else "none.wav"
+                if answer == expected or wav == expected:
+                    correct += 1
+        rounds += 1
+    elapsed = sum(times) / 1e9
+    ordered = sorted(times)
+    rate = f"{correct / checked * 100:6.1f}%" if checked else "     -"
+    print(f"  {name:<28} {len(times) / elapsed:>10.0f}/s  p50 {_percentile(ordered, 0.5) / 1000:8.1f}µs"
+          f"  p95 {_percentile(ordered, 0.95) / 1000:8.1f}µs  p99 {_percentile(ordered, 0.99) / 1000:8.1f}µs  一致率 {rate}")
+
+
+def run_matchers(corpus, data, label):
+    print(f"\n=== {label}: キーワード {sum(len(v) for v in data['rules'].values())}件 / 質問 {len(corpus)}件 ===")
+    response_map = data.get("response_map", {})
+    for name, func in matchers_for(data):
+        bench(name, func, corpus, response_map)
+
+
+def replay(corpus, data_path, thinking=0.0, clear=0.02, timeout=5.0):
+    """
+    main.main を一時フォルダ(BASE_DIR の代わり)で動かし、コーパスを1問ずつ current_question.txt に
+    書き込んで、検知から後片付けまでの通しの時間を計測する。
+    """
+    import main
+
+    tmp_dir = tempfile.mkdtemp(prefix="rensou_bench_")
+    shutil.copy(data_path, os.path.join(tmp_dir, main.JSON_FILE_NAME))
+    main.BASE_DIR = tmp_dir
+    main.OUTPUT_MODE = "file"
+    main.THINKING_DELAY = thinking
+    main.THINKING_DELAYS = {}
+    main.CLEAR_DELAY = clear
+    # チャットの入口は使わない (通しの計測は文字起こしのみ)
+    main.CHAT_SOCKET_ADDRESS = None
+    main.CHAT_LOG_FILE = None
+    # 計測中にグローバルホットキーを登録しない
+    main.keyboard.add_hotkey = lambda *args, **kwargs: None
+
+    input_path = os.path.join(tmp_dir, main.INPUT_TEXT_FILE)
+    with open(input_path, "w", encoding="utf-8") as f:
+        f.write("")
+    threading.Thread(target=main.main, daemon=True).start()
+
+    deadline = time.monotonic() + timeout
+    while main.pipeline.loop is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    print(f"\n=== 通し計測 (main.main / {tmp_dir}) ===")
+    lost = 0
+    for text, _ in corpus:
+        if not text.strip():
+            continue
+        before = main.latency.count
+        with open(input_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        deadline = time.monotonic() + timeout
+        while main.latency.count == before and time.monotonic() < deadline:
+            time.sleep(0.001)
+        if main.latency.count == before:
+            lost += 1
+    main.latency.print_stats()
+    if lost:
+        print(f"  ★時間内に答えられなかった質問: {lost}件")
+
+    # 実際に再生された wav を正解と比べる (ログは質問の順に並んでいる)
+    with open(data_path, "r", encoding="utf-8") as f:
+        response_map = json.load(f).get("response_map", {})
+    played = load_corpus(os.path.join(tmp_dir, main.LATENCY_LOG_FILE))
+    correct = checked = 0
+    for (text, expected), (_, wav) in zip([c for c in corpus if c[0].strip()], played):
+        if expected is UNKNOWN:
+            continue
+        checked += 1
+        want = response_map.get(expected, main.DEFAULT_WAV) if expected is not None else main.DEFAULT_WAV
+        if wav == want or wav == expected:
+            correct += 1
+        else:
+            print(f"  ✗ {text} → {wav} (正解 {want})")
+    if checked:
+        print(f"  一致率 {correct / checked * 100:.1f}% ({correct}/{checked})")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def similar_check(path=SIMILAR_SAMPLES, threshold=paraphrase_index.DEFAULT_THRESHOLD):
+    """
+    キーワードでは見つからない質問だけを言い換え検索にかけ、しきい値ごとの
+    正解数 (言い換えを正しく拾えた) と誤答数 (無関係な質問に答えた・違うルールを返した) を表示する。
+    しきい値の一覧は "split": "tune" の行 (しきい値を決めるのに使った行) で作り、
+    threshold の良し悪しは "holdout" の行 (決めるときに見ていない行) で確かめる。
+    threshold でどちらかに誤答が出たら False。
+    """
+    matchers = {}
+    scored = {"tune": [], "holdout": []}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            matcher = matchers.get(row["data"])
+            if matcher is None:
+                with open(os.path.join(BASE_DIR, row["data"]), "r", encoding="utf-8") as df:
+                    matcher = matchers[row["data"]] = rule_engine.compile_rules(knowledge_store.import_item(json.load(df)))
+            text = main_normalize(row["text"])
+            if matcher.match(text) or matcher.match_fuzzy(text):
+                print(f"  (キーワードで一致するので点検しない) {row['text']}")
+                continue
+            score, rule = matcher.similar_score(text)
+            keyword = rule[0] if rule else None
+            right = row["expected"] is not None and keyword == row["expected"]
+            split = row.get("split", "tune")
+            scored[split].append((score, right, row))
+            mark = "○" if right else ("-" if row["expected"] is None else "×")
+            print(f"  {mark} {score:.2f}  {split:<7}  {row['text']:<38} → {keyword}")
+
+    def count(rows, t):
+        hits = sum(1 for s, right, _ in rows if s >= t and right)
+        wrong = sum(1 for s, right, _ in rows if s >= t and not right)
+        return hits, wrong
+
+    tune, holdout = scored["tune"], scored["holdout"]
+    positives = sum(1 for _, _, row in tune if row["expected"] is not None)
+    print(f"\n  tune ({len(tune)}件)\n  しきい値  正解 (/{positives})  誤答")
+    for t in sorted({0.5, 0.55, 0.6, 0.65, 0.7, 0.75, 0.8, threshold}):
+        hits, wrong = count(tune, t)
+        mark = " ←今の値" if t == threshold else ""
+        print(f"  {t:.2f}      {hits:>3}          {wrong:>3}{mark}")
+    tune_wrong = count(tune, threshold)[1]
+
+    positives = sum(1 for _, _, row in holdout if row["expected"] is not None)
+    hits, wrong = count(holdout, threshold)
+    worst = max((s for s, _, row in holdout if row["expected"] is None), default=0.0)
+    print(f"\n  holdout ({len(holdout)}件) しきい値 {threshold}: 正解 {hits}/{positives}  誤答 {wrong}"
+          f"  (無関係な質問の最高 {worst:.2f})")
+    if tune_wrong or wrong:
+        print(f"★しきい値 {threshold} で無関係な質問に答えています")
+    return not tune_wrong and not wrong
+
+
+def intake_check():
+    """question_intake.QuestionIntake の受付ルールを、時計を進めながら1つずつ確かめる。全部通れば True。"""
+    Question = question_intake.Question
+    results = []
+
+    def check(name, ok):
+        results.append(ok)
+        print(f"  {'○' if ok else '×'} {name}")
+
+    now = [0.0]
+    clock = lambda: now[0]
+
+    # 重複: dedup_window 秒以内の同じ質問 (表記ゆれ込み) は別の人からでも受け付けない
+    intake = question_intake.QuestionIntake(dedup_window=20.0, clock=clock)
+    check("重複: 最初の質問は受け付ける", intake.offer(Question("Is it big?", "chat", "alice")))
+    check("重複: 20秒以内の同じ質問は捨てる", not intake.offer(Question("is it  BIG", "chat", "bob")))
+    now[0] += 21.0
+    check("重複: 20秒たてば受け付ける", intake.offer(Question("is it big", "chat", "bob")))
+    check("重複: 配信者の質問は重複でも捨てない",
+          intake.offer(Question("is it big", "transcript", priority=reaction_pipeline.PRIORITY_TRANSCRIPT)))
+
+    # トークンバケツ: 30秒あたり3問。使い切ったら 10 秒で1問ぶん戻る
+    now[0] = 0.0
+    intake = question_intake.QuestionIntake(user_burst=3, per_seconds=30.0, clock=clock)
+    taken = [intake.offer(Question(f"question {i}", "chat", "alice")) for i in range(4)]
+    check("回数制限: 3問までは受け付け、4問目は捨てる", taken == [True, True, True, False])
+    check("回数制限: ほかの人は別に数える", intake.offer(Question("question x", "chat", "bob")))
+    now[0] += 5.0
+    check("回数制限: 5秒では戻らない", not intake.offer(Question("question 5", "chat", "alice")))
+    now[0] += 5.0
+    check("回数制限: 10秒で1問ぶん戻る", intake.offer(Question("question 6", "chat", "alice")))
+    check("回数制限: 件数を数えている", intake.counts["rate_limited"] == 2)
+
+    # あふれ: 優先度の低い古い質問から捨てる。配信者の質問はチャットのために捨てない
+    intake = question_intake.QuestionIntake(max_pending=2, clock=clock)
+    for i in range(2):
+        intake.offer(Question(f"chat {i}", "chat", f"user{i}"))
+    streamer = Question("is it red", "transcript", priority=reaction_pipeline.PRIORITY_TRANSCRIPT)
+    check("あふれ: 配信者の質問はチャットを1つ捨てて入る", intake.offer(streamer) and len(intake) == 2)
+    check("あふれ: 捨てたのは一番古いチャット",
+          [q.text for q in intake._queues[reaction_pipeline.PRIORITY_CHAT]] == ["chat 1"])
+    intake.offer(Question("is it blue", "transcript", priority=reaction_pipeline.PRIORITY_TRANSCRIPT))
+    check("あふれ: 配信者の質問だけで満杯ならチャットは入らない",
+          not intake.offer(Question("chat 2", "chat", "user2")) and intake.counts["dropped"] == 3)
+
+    # 読めない行: 捨てて数えるだけ (例外で入口を止めない)
+    intake = question_intake.QuestionIntake(clock=clock)
+    check("読めない行: user が文字列でなければ anonymous",
+          question_intake.parse_line('{"user": ["bob"], "text": "is it big"}') == ("anonymous", "is it big"))
+    check("読めない行: text が文字列でなければ受け付けない",
+          not question_intake.offer_line(intake, '{"user": "bob", "text": 5}', "chatlog"))
+    check("読めない行: user が数値でも受け付ける",
+          question_intake.offer_line(intake, '{"user": 42, "text": "is it big"}', "chatlog"))
+
+    # チャットの間隔: chat_interval 秒に1問。待っている間に来た配信者の質問は先に渡す
+    async def pacing():
+        intake = question_intake.QuestionIntake(chat_interval=0.2)
+        for i in range(3):
+            intake.offer(Question(f"chat {i}", "chat", f"user{i}"))
+        start = time.monotonic()
+        got = [await intake.get()]
+        asyncio.get_running_loop().call_later(0.05, intake.offer, Question(
+            "is it red", "transcript", priority=reaction_pipeline.PRIORITY_TRANSCRIPT))
+        got.append(await intake.get())
+        streamer_at = time.monotonic() - start
+        got.append(await intake.get())
+        chat_at = time.monotonic() - start
+        return [q.text for q in got], streamer_at, chat_at
+
+    order, streamer_at, chat_at = asyncio.run(pacing())
+    check("チャットの間隔: 待っている間の配信者の質問が先", order == ["chat 0", "is it red", "chat 1"])
+    check(f"チャットの間隔: 配信者の質問はすぐ ({streamer_at * 1000:.0f}ms)", streamer_at < 0.15)
+    check(f"チャットの間隔: 次のチャットは 0.2 秒あける ({chat_at * 1000:.0f}ms)", chat_at >= 0.19)
+
+    if not all(results):
+        print(f"★質問受付の確認で {results.count(False)} 件失敗しました")
+    return all(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="照合処理・回答パイプラインのベンチマーク")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="質問のコーパス (.jsonl / .txt)")
+    parser.add_argument("--data", default=DEFAULT_DATA, help="知識データ (rules 形式の JSON)")
+    parser.add_argument("--synthetic", type=int, default=10000, help="合成データのキーワード数 (0で省略)")
+    parser.add_argument("--realistic", type=int, default=10000,
+                        help="言い換え検索を計測する本物の語彙のフレーズ数 (0で省略)")
+    parser.add_argument("--replay", action="store_true", help="main.main を一時フォルダで動かして通しで計測")
+    parser.add_argument("--similar-check", action="store_true", help="言い換え検索のしきい値を点検する")
+    parser.add_argument("--intake-check", action="store_true", help="質問受付の重複・回数制限・あふれ・間隔を確かめる")
+    args = parser.parse_args()
+
+    if args.similar_check:
+        return 0 if similar_check() else 1
+    if args.intake_check:
+        return 0 if intake_check() else 1
+
+    corpus = load_corpus(args.corpus)
+    with open(args.data, "r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    run_matchers(corpus, data, os.path.basename(args.data))
+    if args.synthetic:
+        run_matchers(corpus, synthetic_data(data, args.synthetic), "合成データ")
+    if args.realistic:
+        run_similar(corpus, data, args.realistic)
+    if args.replay:
+        replay(corpus, args.data)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,65 @@
+from collections import deque
+
+# 上級者モードで画面に残すメッセージ数 (古いものから捨てて件数だけ数えておく)
+HISTORY_LIMIT = 200
+
+_STATUS_ICONS = {"success": "🟢", "error": "🔴"}
+
+
+def render_message(chat):
+    """1件分の吹き出しHTMLを作る (メッセージを追加したときに1回だけ呼ばれる)。"""
+    if chat["role"] == "user":
+        return f'<div class="user-bubble">{chat["content"]}</div>'
+    icon = _STATUS_ICONS.get(chat.get("status"), "🟡")
+    return (f'<div class="bot-bubble-container"><div class="bot-avatar">🤖</div>'
+            f'<div class="bot-bubble">{icon} {chat["content"]}</div></div>')
+
+
+class ChatHistory:
+    """
+    上級者モードのチャット履歴。
+    - 直近 limit 件だけを持つリングバッファ (あふれた分は archived に件数だけ残す)
+    - 吹き出しのHTMLは追加時に作って保存するので、再描画のたびに全件を組み立て直さない
+    - 判明した手がかりは dict (追加順を保つ集合) で持ち、重複チェックは O(1)
+    """
+
+    def __init__(self, limit=HISTORY_LIMIT):
+        self.messages = deque(maxlen=limit)
+        self.archived = 0
+        self.clues = {}
+        self._html = None
+
+    def __len__(self):
+        return len(self.messages)
+
+    def append(self, role, content, status=None):
+        chat = {"role": role, "content": content}
+        if status is not None:
+            chat["status"] = status
+        if len(self.messages) == self.messages.maxlen:
+            self.archived += 1
+        self.messages.append((chat, render_message(chat)))
+        self._html = None
+
+    def add_clue(self, clue):
+        """新しい手がかりなら True。"""
+        if clue in self.clues:
+            return False
+        self.clues[clue] = None
+        return True
+
+    def html(self):
+        """チャット欄全体のHTML (新しい順)。履歴が変わったときだけ作り直す。"""
+        if self._html is None:
+            fragments = [fragment for _, fragment in reversed(self.messages)]
+            self._html = '<div class="chat-scroll-area">' + "".join(fragments) + '</div>'
+        return self._html
+
+    def clue_html(self):
+        return "".join(f'<span class="clue-item">{clue}</span>' for clue in self.clues)
+
+    def clear(self):
+        self.messages.clear()
+        self.archived = 0
+        self.clues.clear()
+        self._html = None
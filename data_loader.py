@@ -0,0 +1,132 @@
+import json
+import os
+import threading
+
+import knowledge_cache
+import knowledge_store
+
+# path -> (更新日時, JSONの中身)
+_json_cache = {}
+# (path, 種類) -> (更新日時, 作ったもの)
+_built_cache = {}
+_lock = threading.Lock()
+# ★コンパイル済みの知識データ。新しいコンテナでも JSON が同じならファイルから読むだけ
+_artifacts = knowledge_cache.ArtifactCache()
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def load_json(path):
+    """
+    JSON をプロセス内で1回だけ読み込む。ファイルの更新日時が変わったら読み直す。
+    ファイルがない・壊れているときは None。
+    ※ 返した dict/list は全セッションで共有しているので書き換えないこと。
+    """
+    mtime = _mtime(path)
+    if mtime is None:
+        return None
+    with _lock:
+        cached = _json_cache.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            value = json.load(f)
+    except Exception:
+        return None
+    with _lock:
+        _json_cache[path] = (mtime, value)
+    return value
+
+
+def _get_built(path, kind, build):
+    mtime = _mtime(path)
+    if mtime is None:
+        return None
+    with _lock:
+        cached = _built_cache.get((path, kind))
+        if cached and cached[0] == mtime:
+            return cached[1]
+    data = load_json(path)
+    if data is None:
+        return None
+    value = build(data)
+    with _lock:
+        _built_cache[(path, kind)] = (mtime, value)
+    return value
+
+
+def get_matcher(path):
+    """知識データのコンパイル済み RuleMatcher。ファイルがない・壊れているときは None。"""
+    mtime = _mtime(path)
+    if mtime is None:
+        return None
+    with _lock:
+        cached = _built_cache.get((path, "matcher"))
+        if cached and cached[0] == mtime:
+            return cached[1]
+    try:
+        matcher = knowledge_store.load_file(path, _artifacts)
+    except (OSError, ValueError):
+        return None
+    with _lock:
+        _built_cache[(path, "matcher")] = (mtime, matcher)
+    return matcher
+
+
+def _build_training_index(training_data, name):
+    tasks_by_category = {}
+    for task in training_data:
+        tasks = tasks_by_category.setdefault(task["category"], [])
+        # 問題ID = ファイル名/カテゴリ内の番号 (同じキーワードが別カテゴリにあってもぶつからない)
+        # ※ 元の dict は共有なので書き換えず、IDつきのコピーを作る
+        task_id = f"{name}/{task['category']}/{len(tasks)}"
+        tasks.append({**task, "id": task_id})
+    categories = sorted(tasks_by_category)
+    return {
+        "name": name,
+        "categories": categories,
+        "category_positions": {cat: i for i, cat in enumerate(categories)},
+        "tasks_by_category": tasks_by_category,
+    }
+
+
+def get_training_index(path):
+    """
+    初級モード用のカテゴリ索引。
+    {"name": ファイル名, "categories": [並べ替え済みカテゴリ], "category_positions": {カテゴリ: 番号},
+     "tasks_by_category": {カテゴリ: [問題 (+ "id"), ...]}}
+    """
+    name = os.path.splitext(os.path.basename(path))[0]
+    return _get_built(path, "training_index", lambda data: _build_training_index(data, name))
+
+
+def get_store(index_path, sources, fallback_response_map=None):
+    """
+    全品物のインデックス (KnowledgeStore)。品物の切り替えは store.matcher(品物ID) を引くだけ。
+    インデックスファイルがない・元のJSONより古いときは、元のJSONからメモリ上で作る。
+    """
+    stamp = tuple(_mtime(p) for p in [index_path] + list(sources))
+    with _lock:
+        cached = _built_cache.get((index_path, "store"))
+        if cached and cached[0] == stamp:
+            return cached[1]
+
+    index = None
+    source_mtimes = [m for m in stamp[1:] if m is not None]
+    if stamp[0] is not None and all(m <= stamp[0] for m in source_mtimes):
+        index = load_json(index_path)
+    try:
+        if index is None:
+            index = knowledge_store.build_index([p for p in sources if _mtime(p) is not None])
+        store = knowledge_store.KnowledgeStore(index, fallback_response_map, cache=_artifacts)
+    except (OSError, ValueError, KeyError):
+        return None
+    with _lock:
+        _built_cache[(index_path, "store")] = (stamp, store)
+    return store
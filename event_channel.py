@@ -0,0 +1,108 @@
+import asyncio
+import json
+import sys
+import time
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 50505
+
+
+class EventChannel:
+    """
+    main.py → OBS 側へのイベント配信サーバー。
+    接続してきたクライアントに {"type": ..., "value": ...} を1行1JSONで送る。
+    address が文字列なら Unix ドメインソケット、(host, port) なら localhost の TCP で待ち受ける。
+    """
+
+    def __init__(self, address=(DEFAULT_HOST, DEFAULT_PORT)):
+        self.address = address
+        self.loop = None
+        self.server = None
+        self._clients = set()
+        # 最新の状態 (後から繋いだクライアントにも最初に送る)
+        self._state = {}
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        if isinstance(self.address, str):
+            self.server = await asyncio.start_unix_server(self._on_connect, path=self.address)
+        else:
+            host, port = self.address
+            self.server = await asyncio.start_server(self._on_connect, host, port)
+        print(f"[イベント配信] {self.address} で待ち受け中")
+
+    async def _on_connect(self, reader, writer):
+        self._clients.add(writer)
+        for event_type, value in self._state.items():
+            writer.write(_encode(event_type, value))
+        try:
+            # クライアントからの入力は使わない。切断されるまで待つだけ
+            while await reader.read(1024):
+                pass
+        except ConnectionError:
+            pass
+        finally:
+            self._clients.discard(writer)
+            writer.close()
+
+    def publish(self, event_type, value):
+        """イベントを配信する。同じ値が続く場合は送らない。どのスレッドから呼んでもよい。"""
+        if self.loop is None:
+            # 待ち受け開始前は状態だけ覚えておく
+            self._state[event_type] = value
+            return
+        self.loop.call_soon_threadsafe(self._broadcast, event_type, value)
+
+    def _broadcast(self, event_type, value):
+        if self._state.get(event_type) == value:
+            return
+        self._state[event_type] = value
+        line = _encode(event_type, value)
+        for writer in list(self._clients):
+            try:
+                writer.write(line)
+            except Exception:
+                self._clients.discard(writer)
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+
+
+def _encode(event_type, value):
+    event = {"type": event_type, "value": value, "time": time.time()}
+    return (json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+async def listen(address=(DEFAULT_HOST, DEFAULT_PORT), on_event=None):
+    """
+    配信を受け取る簡易クライアント (OBS 側の代わりの動作確認用)。
+    on_event を省略すると受け取ったイベントを表示する。
+    """
+    if isinstance(address, str):
+        reader, writer = await asyncio.open_unix_connection(address)
+    else:
+        reader, writer = await asyncio.open_connection(*address)
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            event = json.loads(line)
+            if on_event:
+                on_event(event)
+            else:
+                print(f"[{event['type']}] {event['value']}")
+    finally:
+        writer.close()
+
+
+if __name__ == "__main__":
+    # 使い方: python event_channel.py [ポート番号 または ソケットのパス]
+    target = (DEFAULT_HOST, DEFAULT_PORT)
+    if len(sys.argv) > 1:
+        target = (DEFAULT_HOST, int(sys.argv[1])) if sys.argv[1].isdigit() else sys.argv[1]
+    try:
+        asyncio.run(listen(target))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,121 @@
+def max_distance(length):
+    """
+    単語の長さごとに許す誤り(編集距離)の数。短い単語は誤爆しやすいので0
+    (6〜9文字: 1文字まで / 10文字以上: 2文字まで)
+    """
+    if length >= 10:
+        return 2
+    if length >= 6:
+        return 1
+    return 0
+
+
+def _deletes(word, depth):
+    """word から depth 文字までを消した文字列をすべて返す (word 自身も含む)。"""
+    result = {word}
+    frontier = {word}
+    for _ in range(depth):
+        next_frontier = set()
+        for w in frontier:
+            for i in range(len(w)):
+                next_frontier.add(w[:i] + w[i + 1:])
+        result |= next_frontier
+        frontier = next_frontier
+    return result
+
+
+def osa_distance(a, b, limit):
+    """
+    編集距離 (隣り合う文字の入れ替えも1回と数える)。limit を超えたら limit + 1 を返す。
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    prev2 = None
+    prev = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        row_min = i
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            v = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+            if prev2 is not None and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                v = min(v, prev2[j - 2] + 1)
+            cur[j] = v
+            row_min = min(row_min, v)
+        if row_min > limit:
+            return limit + 1
+        prev2, prev = prev, cur
+    return prev[-1]
+
+
+class FuzzyIndex:
+    """
+    Whisper の聞き間違い・つづり間違い用のあいまい検索 (SymSpell 方式)。
+    キーワードに出てくる単語から数文字消した文字列をあらかじめ辞書に登録しておき、
+    入力の単語も同じように消して辞書を引くだけなので、全キーワードと比べる必要がない。
+    直した単語で文を組み直し、もう一度オートマトンに通すのは RuleMatcher 側の仕事。
+    """
+
+    def __init__(self, keywords):
+        # 単語 → 登場順 (同じ距離の候補が複数あるときは先に出てきた単語を優先)
+        self.vocab = {}
+        for keyword in keywords:
+            for word in keyword.split():
+                self.vocab.setdefault(word, len(self.vocab))
+
+        self._deletes = {}
+        self._max_len = 0
+        for word in self.vocab:
+            depth = max_distance(len(word))
+            if depth == 0:
+                continue
+            self._max_len = max(self._max_len, len(word))
+            for d in _deletes(word, depth):
+                self._deletes.setdefault(d, []).append(word)
+
+    def to_state(self):
+        return {"vocab": self.vocab, "deletes": self._deletes, "max_len": self._max_len}
+
+    @classmethod
+    def from_state(cls, state):
+        index = cls.__new__(cls)
+        index.vocab = state["vocab"]
+        index._deletes = state["deletes"]
+        index._max_len = state["max_len"]
+        return index
+
+    def correct_word(self, word):
+        """辞書にない単語を、いちばん近い辞書の単語に直す。直せなければ None。"""
+        if word in self.vocab or len(word) > self._max_len + 2:
+            return None
+        depth = max_distance(len(word) + 2)
+        if depth == 0:
+            return None
+        best = None
+        seen = set()
+        for d in _deletes(word, depth):
+            for candidate in self._deletes.get(d, ()):
+                if candidate in seen:
+                    continue
+                seen.add(candidate)
+                limit = max_distance(len(candidate))
+                dist = osa_distance(word, candidate, limit)
+                if dist > limit:
+                    continue
+                key = (dist, self.vocab[candidate])
+                if best is None or key < best[0]:
+                    best = (key, candidate)
+        return best[1] if best else None
+
+    def correct(self, text):
+        """
+        正規化済みの text の単語を直した文を返す。1語も直らなければ None。
+        """
+        words = text.split()
+        changed = False
+        for i, word in enumerate(words):
+            fixed = self.correct_word(word)
+            if fixed:
+                words[i] = fixed
+                changed = True
+        return " ".join(words) if changed else None
@@ -0,0 +1,194 @@
+"""
+初級モード(音読ドリル)の採点。
+
+お手本の文と読み上げ結果を単語に分け、語順を保ったまま対応づけて (聞き間違い程度のつづり違いは同じ単語扱い)、
+お手本の単語のうち言えた割合を点数にする。言えなかった単語も返すので「どこが惜しいか」を表示できる。
+
+使い方 (採点の事前チェック):
+  python grading.py training_data_en.json                 # 各お手本から作った言い間違いの例を採点
+  python grading.py training_data_es.json samples.jsonl   # {"question": お手本, "text": 読み上げ} を採点
+"""
+import functools
+import json
+import sys
+import unicodedata
+
+import fuzzy_index
+import text_processor
+
+# これ以上なら合格 (キーワードのないフレーズ) / これ以上なら「惜しい」
+PASS_SCORE = 0.85
+ALMOST_SCORE = 0.5
+
+VERDICT_GOOD = "good"
+VERDICT_ALMOST = "almost"
+VERDICT_RETRY = "retry"
+
+
+@functools.lru_cache(maxsize=4096)
+def tokenize(text):
+    """正規化して単語に分ける。アクセント記号も外す ("Está" と "esta" を同じ単語にする)。"""
+    text = unicodedata.normalize("NFKD", text_processor.normalize_text(text))
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return tuple(text.split())
+
+
+def same_word(a, b):
+    """同じ単語か (長い単語は1〜2文字のつづり違いまで許す)。"""
+    if a == b:
+        return True
+    limit = fuzzy_index.max_distance(min(len(a), len(b)))
+    return limit > 0 and fuzzy_index.osa_distance(a, b, limit) <= limit
+
+
+def align(target, spoken):
+    """
+    お手本 target と読み上げ spoken (どちらも単語のタプル) を語順どおりに対応づける (最長共通部分列)。
+    言えたお手本の単語の位置のリストを返す。
+    """
+    n, m = len(target), len(spoken)
+    # table[i][j] = target[i:] と spoken[j:] で対応づけられる単語の数
+    table = [[0] * (m + 1) for _ in range(n + 1)]
+    for i in range(n - 1, -1, -1):
+        row, below = table[i], table[i + 1]
+        for j in range(m - 1, -1, -1):
+            if same_word(target[i], spoken[j]):
+                row[j] = below[j + 1] + 1
+            else:
+                row[j] = max(below[j], row[j + 1])
+    matched = []
+    i = j = 0
+    while i < n and j < m:
+        if same_word(target[i], spoken[j]) and table[i][j] == table[i + 1][j + 1] + 1:
+            matched.append(i)
+            i += 1
+            j += 1
+        elif table[i + 1][j] >= table[i][j + 1]:
+            i += 1
+        else:
+            j += 1
+    return matched
+
+
+class Grade:
+    def __init__(self, score, verdict, missed):
+        self.score = score
+        self.verdict = verdict
+        # 言えなかったお手本の単語 (お手本の順)
+        self.missed = missed
+
+    @property
+    def passed(self):
+        return self.verdict == VERDICT_GOOD
+
+    def __repr__(self):
+        return f"Grade({self.score:.2f}, {self.verdict}, missed={self.missed})"
+
+
+def grade(utterance, question, keyword=""):
+    """
+    読み上げ utterance をお手本 question で採点する。
+    キーワード(そのフレーズの要)が言えていれば、ほかの単語が抜けていても合格 (従来と同じ基準)。
+    キーワードが言えていなければ、ほかがどれだけ言えていても「惜しい」止まり。
+    """
+    target = tokenize(question)
+    spoken = tokenize(utterance)
+    if not target:
+        return Grade(1.0, VERDICT_GOOD, [])
+    matched = set(align(target, spoken))
+    score = len(matched) / len(target)
+    missed = [word for i, word in enumerate(target) if i not in matched]
+
+    key = tokenize(keyword) if keyword else ()
+    if key:
+        # キーワードがあるフレーズは、キーワードを言えたかどうかで合否を決める
+        # (お手本の文をまるごと言えた場合も合格。キーワードが文中と違う表記のフレーズがあるため)
+        if _contains(spoken, key) or not missed:
+            return Grade(score, VERDICT_GOOD, missed)
+    elif score >= PASS_SCORE:
+        return Grade(score, VERDICT_GOOD, missed)
+    if score >= ALMOST_SCORE:
+        return Grade(score, VERDICT_ALMOST, missed)
+    return Grade(score, VERDICT_RETRY, missed)
+
+
+def _contains(spoken, key):
+    """spoken の中に key の単語がこの順に並んでいるか。"""
+    k = len(key)
+    for start in range(len(spoken) - k + 1):
+        if all(same_word(key[i], spoken[start + i]) for i in range(k)):
+            return True
+    return False
+
+
+# --- まとめて採点 (お手本データの事前チェック) ---
+
+def sample_utterances(task):
+    """お手本から、よくある言い方の例を作る。[(種類, 読み上げ, 合格するべきか)]"""
+    words = task["question"].rstrip("?？!！.。").split()
+    samples = [("exact", task["question"], True)]
+    if task.get("keyword"):
+        samples.append(("keyword_only", task["keyword"], True))
+    if len(words) > 2:
+        samples.append(("drop_first", " ".join(words[1:]), None))
+        samples.append(("drop_last", " ".join(words[:-1]), None))
+    samples.append(("unrelated", "what is this", False))
+    return samples
+
+
+def grade_batch(tasks, samples=None):
+    """
+    tasks (お手本のリスト) を採点して、1件ずつ結果の dict を返す。
+    samples ({お手本の文: [読み上げ, ...]}) を渡さなければ sample_utterances で作った例を使う。
+    """
+    for task in tasks:
+        if samples is None:
+            cases = sample_utterances(task)
+        else:
+            cases = [("sample", text, None) for text in samples.get(task["question"], [])]
+        for kind, text, expected in cases:
+            result = grade(text, task["question"], task.get("keyword", ""))
+            yield {
+                "category": task.get("category"),
+                "question": task["question"],
+                "kind": kind,
+                "text": text,
+                "score": round(result.score, 3),
+                "verdict": result.verdict,
+                "missed": result.missed,
+                "expected": expected,
+            }
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        return 1
+    with open(sys.argv[1], "r", encoding="utf-8") as f:
+        tasks = json.load(f)
+    samples = None
+    if len(sys.argv) > 2:
+        samples = {}
+        with open(sys.argv[2], "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    row = json.loads(line)
+                    samples.setdefault(row["question"], []).append(row["text"])
+
+    counts = {}
+    wrong = 0
+    for row in grade_batch(tasks, samples):
+        print(json.dumps(row, ensure_ascii=False))
+        verdicts = counts.setdefault(row["kind"], {})
+        verdicts[row["verdict"]] = verdicts.get(row["verdict"], 0) + 1
+        if row["expected"] is not None and row["expected"] != (row["verdict"] == VERDICT_GOOD):
+            wrong += 1
+    for kind, verdicts in counts.items():
+        print(f"{kind:<14} " + " / ".join(f"{v}: {n}" for v, n in sorted(verdicts.items())), file=sys.stderr)
+    if wrong:
+        print(f"★想定と違う判定: {wrong}件", file=sys.stderr)
+    return 1 if wrong else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
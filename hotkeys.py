@@ -0,0 +1,19 @@
+"""
+テンキーで流す手動リアクションの一覧。
+main.py (ホットキーの登録) と audio_manifest.py (音声素材の点検) の両方がここを読む。
+"""
+
+# キー → (ログに出す文, 再生する wav)
+KEY_MAPPINGS = {
+    "num 1": ("そうだべ！", "soudabe.wav"),
+    "num 2": ("たしかに", "usually_yes.wav"),
+    "num 3": ("なるほど！", "strong_yes.wav"),
+    "num 4": ("うーん...", "depends.wav"),
+    "num 5": ("ちがうよ", "no.wav"),
+    "num 0": ("正解！！", "correct.wav")
+}
+
+
+def wavs():
+    """ホットキーで再生する wav 名の一覧。"""
+    return [wav for _, wav in KEY_MAPPINGS.values()]
@@ -0,0 +1,141 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+
+# inotify の定数 (linux/inotify.h)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class PollingWatcher:
+    """
+    従来どおり mtime を一定間隔で確認する監視クラス (どのOSでも動く)。
+    変化を見つけたら、mtime とサイズが settle 秒間止まるまで待ってから知らせる。
+    """
+
+    def __init__(self, path, interval=0.1, settle=0.05):
+        self.path = path
+        self.interval = interval
+        self.settle = settle
+        self.last_stat = self._stat()
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def wait(self, timeout=None):
+        """ファイルが書き換わり、書き込みが落ち着いたら True。timeout 秒で何もなければ False。"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            stat = self._stat()
+            if stat is not None and stat != self.last_stat:
+                # 書き込み途中を読まないよう、変化が止まるまで待つ
+                while True:
+                    time.sleep(self.settle)
+                    new_stat = self._stat()
+                    if new_stat == stat:
+                        break
+                    stat = new_stat
+                self.last_stat = stat
+                return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(self.interval)
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """
+    Linux の inotify で監視するクラス。ポーリングせず、書き込み完了(close)の瞬間に起きる。
+    ファイルではなく親フォルダを監視するので、置き換え(os.replace)での更新も拾える。
+    """
+
+    def __init__(self, path, settle=0.05):
+        self.path = path
+        self.settle = settle
+        self.name = os.fsencode(os.path.basename(path))
+
+        libc_name = ctypes.util.find_library("c")
+        if not libc_name:
+            raise OSError("libc が見つかりません")
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("inotify 非対応の環境です")
+
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 失敗")
+        mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+        dir_path = os.fsencode(os.path.dirname(os.path.abspath(path)))
+        if libc.inotify_add_watch(self.fd, dir_path, mask) < 0:
+            err = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(err, "inotify_add_watch 失敗")
+
+    def _read_events(self):
+        # 対象ファイルのイベントだけを取り出して mask の OR を返す (なければ 0)
+        try:
+            buf = os.read(self.fd, 4096)
+        except BlockingIOError:
+            return 0
+        mask = 0
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(buf):
+            _, ev_mask, _, name_len = _EVENT_HEADER.unpack_from(buf, offset)
+            offset += _EVENT_HEADER.size
+            name = buf[offset:offset + name_len].rstrip(b"\0")
+            offset += name_len
+            if name == self.name:
+                mask |= ev_mask
+        return mask
+
+    def wait(self, timeout=None):
+        """ファイルが書き換わり、書き込みが落ち着いたら True。timeout 秒で何もなければ False。"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            ready, _, _ = select.select([self.fd], [], [], remaining)
+            if not ready:
+                return False
+            mask = self._read_events()
+            if not mask:
+                continue
+
+            # デバウンス: close / rename 済みならその時点で書き込みは完了している。
+            # 変更(modify)だけなら settle 秒間イベントが止まるまで待つ
+            while not mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                ready, _, _ = select.select([self.fd], [], [], self.settle)
+                if not ready:
+                    break
+                mask |= self._read_events()
+            return True
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+def create_watcher(path, interval=0.1, settle=0.05):
+    """inotify が使えればそれを、だめなら従来のポーリング監視を返す。"""
+    try:
+        watcher = InotifyWatcher(path, settle=settle)
+        print("[入力監視] inotify モード")
+        return watcher
+    except (OSError, AttributeError) as e:
+        print(f"[入力監視] ポーリングモード ({e})")
+        return PollingWatcher(path, interval=interval, settle=settle)
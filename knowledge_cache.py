@@ -0,0 +1,202 @@
+"""
+コンパイル済みの知識データ (RuleMatcher) をファイルに保存しておくキャッシュ。
+
+起動のたびに JSON を読んでルール・曖昧一致・言い換えの索引を作り直さないように、
+コンパイル結果 (RuleMatcher.to_state() の表) を .knowledge_cache/ に JSON で置き、次からは読むだけにする。
+中身はただのデータなので、読み込みでプログラムが動くことはない。
+ファイルの先頭行には本文の SHA-1 を書いておき、読むときに照合する (途中で切れた・書き換わったファイルは使わない)。
+キーは元の JSON の中身 (バイト列) とコンパイル側のコードのハッシュなので、
+JSON を書き換えたとき・rule_engine 等を直したときだけ作り直しになる。
+
+main.py・app.py などの起動時は、キャッシュにない品物をそのプロセスの中で順にコンパイルする
+(品物は数件で、起動のたびに子プロセスを立てるほうが遅いため。読み込みも mmap は使わず JSON を読むだけ)。
+品物が多くて作り直しに時間がかかるときは、下の --workers で別プロセスに分けて先に作っておく。
+
+使い方 (キャッシュを作っておく):
+  python knowledge_cache.py                                # 既定の知識データ全部
+  python knowledge_cache.py microwave_data.json Fridge_data.json
+  python knowledge_cache.py --workers 4 *.json             # 品物が多いときはプロセスを分けて作る
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import rule_engine
+
+# 保存形式を変えたら上げる
+CACHE_FORMAT = 2
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CACHE_DIR = os.path.join(BASE_DIR, ".knowledge_cache")
+CACHE_EXTENSION = ".json"
+# コンパイル結果の中身を決めるモジュール (ここが変わったらキャッシュは使わない)
+COMPILER_MODULES = ["rule_engine.py", "fuzzy_index.py", "paraphrase_index.py", "text_processor.py", "knowledge_store.py"]
+
+_code_stamp = None
+
+
+def code_stamp():
+    """コンパイル側のコードのハッシュ (プロセス内で1回だけ計算)。"""
+    global _code_stamp
+    if _code_stamp is None:
+        h = hashlib.sha1(f"format={CACHE_FORMAT}".encode("ascii"))
+        for name in COMPILER_MODULES:
+            try:
+                with open(os.path.join(BASE_DIR, name), "rb") as f:
+                    h.update(f.read())
+            except OSError:
+                h.update(name.encode("ascii"))
+        _code_stamp = h.hexdigest()
+    return _code_stamp
+
+
+def content_key(raw):
+    """元データ (バイト列) → キャッシュのキー。"""
+    h = hashlib.sha1(code_stamp().encode("ascii"))
+    h.update(raw)
+    return h.hexdigest()[:20]
+
+
+def data_key(data):
+    """知識データ (dict) → キャッシュのキー。キーの並び順が違うだけなら同じキーになる。"""
+    return content_key(json.dumps(data, ensure_ascii=False, sort_keys=True).encode("utf-8"))
+
+
+def encode(key, matcher):
+    """キャッシュファイルの中身 = 本文の SHA-1 (1行目) + 本文 ({"key", "state"} の JSON)。"""
+    body = json.dumps({"key": key, "state": matcher.to_state()}, ensure_ascii=False, separators=(",", ":"))
+    body = body.encode("utf-8")
+    return hashlib.sha1(body).hexdigest().encode("ascii") + b"\n" + body
+
+
+def decode(key, blob):
+    """encode() の逆。SHA-1 やキーが合わなければ ValueError。"""
+    checksum, _, body = blob.partition(b"\n")
+    if hashlib.sha1(body).hexdigest().encode("ascii") != checksum:
+        raise ValueError("チェックサムが合いません")
+    payload = json.loads(body.decode("utf-8"))
+    if payload.get("key") != key:
+        raise ValueError("キーが合いません")
+    return rule_engine.RuleMatcher.from_state(payload["state"])
+
+
+class ArtifactCache:
+    """
+    キャッシュフォルダ。1品物 = 1ファイル ("名前-キー.json")。
+    同じ名前の古いキーのファイルは、新しいものを保存したときに消す。
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, name, key):
+        return os.path.join(self.cache_dir, f"{name}-{key}{CACHE_EXTENSION}")
+
+    def has(self, name, key):
+        return os.path.exists(self._path(name, key))
+
+    def load(self, name, key):
+        """保存済みの RuleMatcher を返す。ない・壊れているときは None。"""
+        try:
+            with open(self._path(name, key), "rb") as f:
+                value = decode(key, f.read())
+        except FileNotFoundError:
+            value = None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"★知識キャッシュが読めません({name}): {e} → 作り直します")
+            value = None
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def save(self, name, key, matcher):
+        self.write(name, key, encode(key, matcher))
+
+    def write(self, name, key, blob):
+        """encode() 済みの中身を書き込む (書き込み途中で落ちても壊れたファイルは残さない)。"""
+        path = self._path(name, key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                f.write(blob)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            # 書けなくても (読み取り専用の環境など) コンパイル結果はそのまま使える
+            print(f"★知識キャッシュを保存できません({name}): {e}")
+            return
+        self._remove_stale(name, os.path.basename(path))
+
+    def _remove_stale(self, name, keep):
+        prefix = f"{name}-"
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return
+        for filename in names:
+            # キーは '-' を含まないので、"名前-キー.json" の名前部分が一致するものだけ
+            if (filename != keep and filename.endswith(CACHE_EXTENSION) and filename.startswith(prefix)
+                    and "-" not in filename[len(prefix):]):
+                try:
+                    os.remove(os.path.join(self.cache_dir, filename))
+                except OSError:
+                    pass
+
+
+def compile_all(jobs, cache):
+    """
+    jobs = [(名前, キー, 知識データを返す関数), ...] をコンパイル済み RuleMatcher にする。
+    キャッシュにあるものは読むだけ。ないものはこのプロセスでコンパイルして保存する。
+    {名前: RuleMatcher} を返す。知識データが不正なら ValueError。
+    """
+    matchers = {}
+    for name, key, get_data in jobs:
+        matcher = cache.load(name, key) if cache is not None else None
+        if matcher is None:
+            matcher = rule_engine.compile_rules(get_data())
+            if cache is not None:
+                cache.save(name, key, matcher)
+        matchers[name] = matcher
+    return matchers
+
+
+def _compile_blob(key, data):
+    """(ワーカープロセス) コンパイルしてキャッシュファイルの中身にする。"""
+    return encode(key, rule_engine.compile_rules(data))
+
+
+def main():
+    # 知識データの読み込みは knowledge_store の仕事 (knowledge_store → knowledge_cache の向きだけにするため、ここで読み込む)
+    import knowledge_store
+
+    parser = argparse.ArgumentParser(description="コンパイル済みの知識データを .knowledge_cache/ に作っておく")
+    parser.add_argument("files", nargs="*", help="知識データの JSON (省略すると既定の品物全部)")
+    parser.add_argument("--workers", type=int, default=0, help="作り直しを並列にするプロセス数 (0 で並列にしない)")
+    args = parser.parse_args()
+
+    paths = [os.path.join(BASE_DIR, p) for p in args.files or knowledge_store.DEFAULT_SOURCES]
+    cache = ArtifactCache()
+    start = time.perf_counter()
+    jobs = [knowledge_store.file_job(path) for path in paths]
+    missing = [(name, key, get_data()) for name, key, get_data in jobs if not cache.has(name, key)]
+    if args.workers > 0 and len(missing) > 1:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            blobs = pool.map(_compile_blob, [key for _, key, _ in missing], [data for _, _, data in missing])
+            for (name, key, _), blob in zip(missing, blobs):
+                cache.write(name, key, blob)
+    matchers = compile_all(jobs, cache)
+    elapsed = (time.perf_counter() - start) * 1000
+    for path, (name, _, _) in zip(paths, jobs):
+        matcher = matchers[name]
+        print(f"{os.path.basename(path)}: {len(matcher)}ルール (digest {matcher.digest})")
+    print(f"→ {cache.cache_dir} ({len(jobs)}件中 作り直し {len(missing)}件, {elapsed:.1f}ms)")
+
+
+if __name__ == "__main__":
+    main()
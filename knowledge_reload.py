@@ -0,0 +1,160 @@
+import os
+import threading
+
+import knowledge_store
+import rule_engine
+
+
+class KnowledgeReloader:
+    """
+    動作中の知識データ(JSON)を監視し、変更されたら裏のスレッドで検証・コンパイルしてから差し替える。
+    差し替えは self.matcher の付け替え1回だけなので、処理中の質問は古いルールのまま最後まで答えられる。
+
+    control_filename のファイルに知識データのファイル名、またはインデックス(store_filename)の
+    品物IDを書くと、その品物に切り替わる。インデックスの品物はコンパイル済みなので切り替えは一瞬。
+
+    cache (knowledge_cache.ArtifactCache) を渡すと、コンパイル結果をファイルに残し、
+    中身の変わっていない知識データは次の起動から読むだけにする。
+    """
+
+    def __init__(self, base_dir, filename, load, control_filename=None, store_filename=None, interval=0.5,
+                 cache=None):
+        self.base_dir = base_dir
+        self.filename = filename
+        self.load = load
+        self.cache = cache
+        self.interval = interval
+        self.control_path = os.path.join(base_dir, control_filename) if control_filename else None
+        self.store_path = os.path.join(base_dir, store_filename) if store_filename else None
+
+        self.matcher = None
+        self.store = None
+        self.version = 0
+        # 質問文形式の品物(response_map なし)に使う対応表 = 最初に読めた品物のもの
+        self.base_response_map = None
+        self._mtime = None
+        self._store_mtime = None
+        self._control_mtime = None
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _stat(self, path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    def load_initial(self):
+        """起動時の読み込み。失敗したら False。"""
+        if not self._reload(self.filename):
+            return False
+        self._load_store()
+        return True
+
+    def _load_store(self):
+        if not self.store_path:
+            return
+        mtime = self._stat(self.store_path)
+        self._store_mtime = mtime
+        if mtime is None:
+            return
+        try:
+            self.store = knowledge_store.load_store(self.store_path, self.base_response_map, cache=self.cache)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"★インデックス読み込み失敗: {e}")
+            return
+        print(f"[知識データ] インデックス v{self.store.version} ({', '.join(self.store.item_ids())})")
+
+    def _reload(self, name):
+        store = self.store
+        if store is not None and name in store:
+            # インデックスの品物はコンパイル済み
+            self._swap(name, store.matcher(name), None)
+            return True
+
+        path = os.path.join(self.base_dir, name)
+        mtime = self._stat(path)
+        try:
+            if self.cache is not None:
+                matcher = knowledge_store.load_file(path, self.cache, self.base_response_map)
+            else:
+                item = knowledge_store.import_item(self.load(name))
+                if not item["response_map"] and self.base_response_map:
+                    item["response_map"] = self.base_response_map
+                matcher = rule_engine.compile_rules(item)
+        except (OSError, ValueError) as e:
+            print(f"★知識データ不正({name}): {e} → 今のルールのまま続けます")
+            if name == self.filename:
+                # 直されるまで同じ版を何度も読み直さない
+                self._mtime = mtime
+            return False
+        self._swap(name, matcher, mtime)
+        return True
+
+    def switch(self, name):
+        """品物 (知識データのファイル名 or インデックスの品物ID) を切り替える。失敗したら False。"""
+        return self._reload(name)
+
+    def _swap(self, name, matcher, mtime):
+        # ★ここで一気に差し替える
+        self.matcher = matcher
+        self.filename = name
+        self._mtime = mtime
+        self.version += 1
+        if self.base_response_map is None:
+            self.base_response_map = matcher.response_map
+        print(f"[知識データ] {name} を読み込みました (v{self.version} / {len(matcher)}ルール)")
+
+    def request_reload(self):
+        """ホットキー等から強制的に読み直す。"""
+        self._mtime = None
+        self._store_mtime = None
+        self._wakeup.set()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._watch, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+
+    def _watch(self):
+        while not self._stop.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            if self._stop.is_set():
+                break
+
+            # インデックスの更新 → 今の品物がインデックスにあれば選び直す
+            if self.store_path and self._stat(self.store_path) != self._store_mtime:
+                self._load_store()
+                if self.store is not None and self.filename in self.store:
+                    self._reload(self.filename)
+
+            # 品物の切り替え指示
+            if self.control_path:
+                control_mtime = self._stat(self.control_path)
+                if control_mtime is not None and control_mtime != self._control_mtime:
+                    first = self._control_mtime is None
+                    self._control_mtime = control_mtime
+                    name = self._read_control()
+                    # 起動時に残っていた指示は、中身が今の品物と違うときだけ従う
+                    if name and (name != self.filename or not first):
+                        self._reload(name)
+                        continue
+
+            # インデックスの品物はファイルを持たないので監視しない
+            if self.store is not None and self.filename in self.store:
+                continue
+            mtime = self._stat(os.path.join(self.base_dir, self.filename))
+            if mtime is not None and mtime != self._mtime:
+                self._reload(self.filename)
+
+    def _read_control(self):
+        try:
+            with open(self.control_path, 'r', encoding='utf-8') as f:
+                return f.read().strip()
+        except Exception:
+            return ""
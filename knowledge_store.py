@@ -0,0 +1,199 @@
+import hashlib
+import json
+import os
+import sys
+
+import knowledge_cache
+import rule_engine
+
+INDEX_FORMAT = 1
+DEFAULT_INDEX_FILE = "knowledge_index.json"
+DEFAULT_SOURCES = ["microwave_data.json", "microwave_data_app.json", "Fridge_data.json"]
+
+# 質問文だけが並んだ形式 (Fridge_data.json) を取り込むときのカテゴリ名
+FLAT_CATEGORY = "category_questions"
+_FLAT_STRIP = "?？!！。.、, "
+
+
+def item_id_from_filename(filename):
+    """microwave_data.json → microwave / microwave_data_app.json → microwave_app"""
+    stem = os.path.splitext(os.path.basename(filename))[0].lower()
+    return stem.replace("_data", "")
+
+
+def import_item(data):
+    """
+    どの形式の知識データでも、同じ形 (item_name / item_name_en / response_map / rules) にそろえる。
+    - rules 形式 (microwave_data.json 等) はそのまま
+    - 質問文 → 回答 だけの形式 (Fridge_data.json) は1カテゴリの rules に変換する
+      (response_map を持たないので、使う側の response_map を借りる)
+    """
+    if not isinstance(data, dict):
+        raise ValueError("知識データが dict ではありません")
+    if "rules" in data:
+        rule_engine.validate_data(data)
+        return {
+            "item_name": data.get("item_name", ""),
+            "item_name_en": data.get("item_name_en", ""),
+            "response_map": dict(data.get("response_map", {})),
+            "rules": {cat: dict(items) for cat, items in data["rules"].items()},
+        }
+
+    rules = {}
+    for question, answer in data.items():
+        if not isinstance(answer, str):
+            raise ValueError(f"{question} の回答が文字列ではありません")
+        keyword = question.lower().strip(_FLAT_STRIP)
+        if keyword:
+            rules.setdefault(keyword, answer)
+    if not rules:
+        raise ValueError("rules がありません")
+    return {
+        "item_name": "",
+        "item_name_en": "",
+        "response_map": {},
+        "rules": {FLAT_CATEGORY: rules},
+    }
+
+
+def build_index(sources, base_dir="."):
+    """
+    複数の知識データファイルから、1つのインデックス (dict) を作る。
+    キーワードと回答は全品物で共有の表に1回だけ登録し、各品物は番号で参照する。
+    """
+    keywords, keyword_ids = [], {}
+    answers, answer_ids = [], {}
+
+    def intern(value, table, ids):
+        idx = ids.get(value)
+        if idx is None:
+            idx = ids[value] = len(table)
+            table.append(value)
+        return idx
+
+    items = {}
+    for filename in sources:
+        with open(os.path.join(base_dir, filename), "r", encoding="utf-8") as f:
+            item = import_item(json.load(f))
+        packed = {}
+        for cat, rules in item["rules"].items():
+            pairs = []
+            for k, v in rules.items():
+                pairs.append(intern(k, keywords, keyword_ids))
+                pairs.append(intern(v, answers, answer_ids))
+            packed[cat] = pairs
+        items[item_id_from_filename(filename)] = {
+            "source": os.path.basename(filename),
+            "item_name": item["item_name"],
+            "item_name_en": item["item_name_en"],
+            "response_map": item["response_map"],
+            "rules": packed,
+        }
+
+    body = {"keywords": keywords, "answers": answers, "items": items}
+    digest = hashlib.sha1(json.dumps(body, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+    return {"format": INDEX_FORMAT, "version": digest[:12], **body}
+
+
+def save_index(index, path):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+class KnowledgeStore:
+    """
+    インデックスを読み込み、品物ID → コンパイル済み RuleMatcher を引けるようにしたもの。
+    コンパイルは読み込み時に全品物ぶん済ませるので、品物の切り替えは辞書を1回引くだけ。
+
+    fallback_response_map は response_map を持たない品物 (質問文形式) に使う対応表。
+    cache (knowledge_cache.ArtifactCache) を渡すと、コンパイル結果をファイルに残して次回は読むだけにする。
+    """
+
+    def __init__(self, index, fallback_response_map=None, precompile=True, cache=None):
+        if index.get("format") != INDEX_FORMAT:
+            raise ValueError(f"インデックスの形式が違います: {index.get('format')}")
+        self.version = index["version"]
+        self.fallback_response_map = fallback_response_map or {}
+        self._keywords = index["keywords"]
+        self._answers = index["answers"]
+        self._items = index["items"]
+        self._matchers = {}
+        self.cache = cache
+        if precompile:
+            # 全品物を起動時にコンパイルしておく (キャッシュにあれば読むだけ。ないものはこのプロセスで順に作る)
+            jobs = {item_id: self._job(item_id) for item_id in self._items}
+            matchers = knowledge_cache.compile_all(list(jobs.values()), cache)
+            self._matchers = {item_id: matchers[job[0]] for item_id, job in jobs.items()}
+
+    def __contains__(self, item_id):
+        return item_id in self._items
+
+    def item_ids(self):
+        return list(self._items)
+
+    def get_data(self, item_id):
+        """品物の知識データを、元の JSON と同じ形の dict で返す。"""
+        item = self._items[item_id]
+        keywords, answers = self._keywords, self._answers
+        rules = {}
+        for cat, pairs in item["rules"].items():
+            rules[cat] = {keywords[pairs[i]]: answers[pairs[i + 1]] for i in range(0, len(pairs), 2)}
+        response_map = item["response_map"] or self.fallback_response_map
+        return {
+            "item_name": item["item_name"],
+            "item_name_en": item["item_name_en"],
+            "response_map": response_map,
+            "rules": rules,
+        }
+
+    def _job(self, item_id):
+        data = self.get_data(item_id)
+        return f"index_{item_id}", knowledge_cache.data_key(data), lambda: data
+
+    def matcher(self, item_id):
+        matcher = self._matchers.get(item_id)
+        if matcher is None:
+            job = self._job(item_id)
+            matcher = self._matchers[item_id] = knowledge_cache.compile_all([job], self.cache)[job[0]]
+        return matcher
+
+
+def file_job(path):
+    """知識データのファイル → knowledge_cache.compile_all に渡す (名前, キー, 読み込み関数)。"""
+    with open(path, "rb") as f:
+        raw = f.read()
+    # キャッシュにあれば JSON は読まない
+    return (item_id_from_filename(path), knowledge_cache.content_key(raw),
+            lambda: import_item(json.loads(raw.decode("utf-8"))))
+
+
+def load_file(path, cache, fallback_response_map=None):
+    """
+    知識データのファイルをコンパイル済みで返す (cache にあれば読むだけ)。
+    response_map を持たない品物 (質問文形式) には fallback_response_map を付ける。
+    ファイルが読めなければ OSError、中身が不正なら ValueError。
+    """
+    job = file_job(path)
+    matcher = knowledge_cache.compile_all([job], cache)[job[0]]
+    if not matcher.response_map and fallback_response_map:
+        matcher.response_map = fallback_response_map
+    return matcher
+
+
+def load_store(path, fallback_response_map=None, precompile=True, cache=None):
+    with open(path, "r", encoding="utf-8") as f:
+        return KnowledgeStore(json.load(f), fallback_response_map, precompile, cache)
+
+
+if __name__ == "__main__":
+    # 使い方: python knowledge_store.py [出力先] [知識データ.json ...]
+    out_path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_INDEX_FILE
+    sources = sys.argv[2:] or DEFAULT_SOURCES
+    index = build_index(sources)
+    save_index(index, out_path)
+    for item_id, item in index["items"].items():
+        count = sum(len(p) // 2 for p in item["rules"].values())
+        print(f"{item_id}: {item['source']} ({count}ルール)")
+    print(f"→ {out_path} (v{index['version']} / キーワード {len(index['keywords'])}件)")
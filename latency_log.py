@@ -0,0 +1,117 @@
+import json
+import logging
+import logging.handlers
+import threading
+import time
+from collections import deque
+
+# 1問あたりの区間 (この順に記録される)
+#   detect: 書き込みを検知 / read: 読み込み完了 / match: ルール照合完了 (キュー待ち + 照合)
+#   start: 回答ステップ開始 (考え中の演出) / write: 出力ファイル反映 / clear: 後片付け完了
+STAGES = ["detect", "read", "match", "start", "write", "clear"]
+
+
+class Trace:
+    """1つの質問の時間計測。mark() で区間の終わりを記録し、finish() でログに書く。"""
+
+    def __init__(self, recorder, text, written_at=None):
+        self.recorder = recorder
+        self.text = text
+        self.wall = time.time()
+        self.t0 = time.monotonic()
+        self.marks = {}
+        # ログに一緒に残す情報 (再生した wav など)
+        self.info = {}
+        # LocalVocal が書き込んでから検知するまでの遅れ (ファイルの更新日時から計算)
+        self.detect_lag = None if written_at is None else max(0.0, self.wall - written_at)
+
+    def mark(self, stage):
+        self.marks[stage] = time.monotonic() - self.t0
+
+    def finish(self):
+        self.recorder.record(self)
+
+
+class LatencyRecorder:
+    """
+    質問ごとの区間タイムを JSONL (1行1JSON) のログに書き、区間ごとの p50/p95/p99 を集計する。
+    ログは max_bytes を超えると <ファイル名>.1, .2 ... にローテーションする。
+    """
+
+    def __init__(self, path=None, max_bytes=1024 * 1024, backups=3, keep=1000):
+        self._durations = {}
+        self._keep = keep
+        # 集計表示はホットキーのスレッドから呼ばれるのでロックする
+        self._lock = threading.Lock()
+        self.count = 0
+        self.logger = None
+        if path:
+            self.logger = logging.getLogger(f"latency.{path}")
+            self.logger.setLevel(logging.INFO)
+            self.logger.propagate = False
+            if not self.logger.handlers:
+                handler = logging.handlers.RotatingFileHandler(
+                    path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                self.logger.addHandler(handler)
+
+    def start(self, text, written_at=None):
+        return Trace(self, text, written_at)
+
+    def _add(self, name, value):
+        values = self._durations.get(name)
+        if values is None:
+            values = self._durations[name] = deque(maxlen=self._keep)
+        values.append(value)
+
+    def record(self, trace):
+        self.count += 1
+        # 区間ごとの所要時間 (前の区間の終わりからの差)
+        durations = {}
+        prev = 0.0
+        for stage in STAGES:
+            if stage in trace.marks:
+                durations[stage] = trace.marks[stage] - prev
+                prev = trace.marks[stage]
+        durations["total"] = prev
+        if trace.detect_lag is not None:
+            durations["detect_lag"] = trace.detect_lag
+        with self._lock:
+            for name, value in durations.items():
+                self._add(name, value)
+
+        if self.logger:
+            self.logger.info(json.dumps({
+                "time": trace.wall,
+                "text": trace.text,
+                "marks": trace.marks,
+                "durations": durations,
+                "info": trace.info,
+            }, ensure_ascii=False))
+
+    def stats(self):
+        """{区間: {"count", "p50", "p95", "p99"}} (秒)"""
+        with self._lock:
+            snapshot = {name: list(values) for name, values in self._durations.items()}
+        result = {}
+        for name, values in snapshot.items():
+            ordered = sorted(values)
+            n = len(ordered)
+            result[name] = {
+                "count": n,
+                "p50": ordered[min(n - 1, int(n * 0.50))],
+                "p95": ordered[min(n - 1, int(n * 0.95))],
+                "p99": ordered[min(n - 1, int(n * 0.99))],
+            }
+        return result
+
+    def print_stats(self):
+        stats = self.stats()
+        if not stats:
+            print("[計測] まだデータがありません")
+            return
+        print(f"\n[計測] 計 {self.count} 問 (直近 {self._keep} 問の集計 / ミリ秒)")
+        names = [s for s in ["detect_lag"] + STAGES + ["total"] if s in stats]
+        for name in names:
+            s = stats[name]
+            print(f"  {name:<10} p50 {s['p50'] * 1000:8.1f}  p95 {s['p95'] * 1000:8.1f}  p99 {s['p99'] * 1000:8.1f}  (n={s['count']})")
@@ -1,12 +1,39 @@
+import asyncio
 import json
 import os
 import time
-import re
-import threading
 import keyboard
+import input_watcher
+import reaction_pipeline
+import output_writer
+import event_channel
+import knowledge_cache
+import knowledge_reload
+import rule_engine
+import latency_log
+import question_intake
+import answer_cache
+import answer_service
+import audio_manifest
+import hotkeys
+import session_journal
+import speculative
 
 # === 設定エリア ===
 JSON_FILE_NAME = "microwave_data.json"
+# ★全品物をまとめたインデックス (python knowledge_store.py で作成)
+KNOWLEDGE_INDEX_FILE = "knowledge_index.json"
+# ★このファイルに知識データのファイル名 or インデックスの品物ID (fridge 等) を書くと、
+#   再起動せずに品物を切り替えられる
+ACTIVE_ITEM_FILE = "active_item.txt"
+# ★コンパイル済みの知識データを置くフォルダ。中身が同じなら次の起動からは読むだけ (None で使わない)
+KNOWLEDGE_CACHE_DIR = ".knowledge_cache"
+# ★回答サービス (python answer_service.py) に照合を任せるときの URL。例: "http://127.0.0.1:50507"
+#   None なら自分で照合する。つながらないときも自分で照合して続ける
+ANSWER_SERVICE_URL = None
+# ★キーワードが見つからないとき、言い換え(似た質問)でも答えるか。
+#   配信では外れた答えより「分からない」のほうが良いので、既定は使わない
+SIMILAR_MATCH = False
 BASE_DIR = r"D:\Rensou_Gamers_Project"
 
 INPUT_TEXT_FILE = "current_question.txt"
@@ -17,16 +44,93 @@ TEMPLATE_FILE = "suggested_templates.txt"
 
 HISTORY_FILE_LEFT = "yes_history_left.txt"
 HISTORY_FILE_RIGHT = "yes_history_right.txt"
-MAX_HISTORY_LINES = 20
+MAX_HISTORY_LINES = 20  # 左の列の行数 (右の列は直近この行数まで)
+HISTORY_FILES = {"left": HISTORY_FILE_LEFT, "right": HISTORY_FILE_RIGHT}
+
+# ★ゲームの出来事 (回答・手がかり・選択位置・品物) の追記専用ログ。落ちても再起動時にここから復元する
+JOURNAL_FILE = "session_journal.jsonl"
+
+# OBS への合図の送り方
+#   "file"   : 従来どおりテキストファイルのみ (auto_wav_player.lua はこちら)
+#   "socket" : ローカルのイベント配信のみ (1行1JSON)
+#   "both"   : 両方
+# (socket / both でポートが使えないときは、警告を出してファイルだけで続ける)
+OUTPUT_MODE = "file"
+EVENT_ADDRESS = ("127.0.0.1", 50505)  # 文字列にすると Unix ドメインソケット
+
+# 合図ファイル → イベント名
+EVENT_TYPES = {
+    OUTPUT_PATH_FILE: "play",
+    THINKING_FILE: "thinking",
+    VIDEO_TRIGGER_FILE: "video",
+}
+
+# ★視聴者チャットからの質問の入口 (None にすると使わない)
+#   CHAT_SOCKET_ADDRESS: 1行1問 ({"user": ..., "text": ...} も可) を受け付けるローカルソケット
+#   CHAT_LOG_FILE: チャット連携ツールが追記する 1行1JSON のログ (追記分を読む)
+CHAT_SOCKET_ADDRESS = ("127.0.0.1", 50506)
+CHAT_LOG_FILE = "chat_log.jsonl"
+# チャットの質問の受付制限 (1人あたり 30秒に3問まで / 同じ質問は20秒間受け付けない / 2秒に1問まで答える)
+CHAT_MAX_PENDING = 30
+CHAT_USER_BURST = 3
+CHAT_USER_SECONDS = 30.0
+CHAT_DEDUP_WINDOW = 20.0
+CHAT_INTERVAL = 2.0
+
+# 質問ごとの時間計測ログ (1行1JSON、1MBごとにローテーション)
+LATENCY_LOG_FILE = "latency_log.jsonl"
 
 AUDIO_DIR_NAME = "audio"
-DEFAULT_WAV = "none.wav"
+# 何にも一致しないときの音声 (batch_answer・audio_manifest と共通)
+DEFAULT_WAV = rule_engine.DEFAULT_WAV
+
+# リアクションの時間配分 (秒)
+THINKING_DELAY = 1.5        # 質問 → 回答まで「考え中」を見せる時間 (下の表にない回答)
+HOTKEY_THINKING_DELAY = 1.0 # ホットキー時の「考え中」時間
+THINKING_HIDE_DELAY = 0.2   # ホットキー時、再生開始から「考え中」を消すまで
+CLEAR_DELAY = 1.0           # 再生開始から出力ファイルを空に戻すまで (音声の長さが分からないとき)
+CLIP_MARGIN = 0.1           # 音声の長さが分かるときは、再生開始から (長さ + この秒数) で後片付け
+
+# ★回答の種類ごとの「考え中」時間 (wav 名 → 秒)
+#   正解はしっかり溜めて、分からない質問・ただのNOはテンポよく返す
+THINKING_DELAYS = {
+    "correct.wav": 2.5,
+    "close.wav": 2.0,
+    "no.wav": 1.0,
+    DEFAULT_WAV: 0.8,
+}
+
+# ★話している途中の文字起こし(LocalVocal の部分結果)を使う先読みモード
+#   部分結果が届くたびに照合しておき、FINAL_QUIET 秒書き込みが止まったら最終結果として確定する。
+#   最終結果が見込みと同じ答えなら、見込みが立った時点から「考え中」を数える (最低 MIN_THINKING_DELAY 秒)
+STREAMING_MODE = False
+FINAL_QUIET = 0.6
+MIN_THINKING_DELAY = 0.3
 
 # 状態管理
-yes_history_list = []
-is_reacting = False
+# ★手がかりボード (左右の列)。起動時にジャーナルから復元する
+board = session_journal.ClueBoard(MAX_HISTORY_LINES)
+journal = None
+# ★ファイル出力は一時ファイル + 置き換えで行い、同じ内容なら書かない
+output = output_writer.OutputWriter()
+# ★リアクションは全てこのキューを通して1つずつ流す (同時刻の書き込みは一括反映)
+pipeline = reaction_pipeline.ReactionPipeline(step_context=output.batch)
+# ★質問ごとの時間計測 (main() で作る)
+latency = latency_log.LatencyRecorder()
+# ★同じ質問の答えは使い回す (知識データが変わったら自動的に別のキーになる)
+answers = answer_cache.AnswerCache()
+# ★回答サービスのクライアント (ANSWER_SERVICE_URL を設定したとき main() で作る)
+service = None
+# ★質問の受付窓口 (run() で作る。Ctrl + L で受付・間引きの件数を表示)
+intake = None
+# ★audio/ の音声素材の一覧 (main() で作る。パスと再生時間は起動時に1回だけ調べる)
+audio = None
+# ★OBS 側へのイベント配信 (OUTPUT_MODE が "file" 以外のとき main() で作る)
+events = None
 # ★質問の選択位置 (0〜7)
 current_selection_index = 0
+# ★最後に自分で入力ファイルへ書いた内容 (ホットキーの「考え中...」など。LocalVocal の書き込みと見分ける)
+own_input_text = None
 
 # 固定の質問リスト
 QUESTIONS = [
@@ -48,24 +152,22 @@ POSITIVE_WAVS = [
     "partial_yes.wav", "correct.wav"
 ]
 
-KEY_MAPPINGS = {
-    "num 1": ("そうだべ！", "soudabe.wav"),
-    "num 2": ("たしかに", "usually_yes.wav"),
-    "num 3": ("なるほど！", "strong_yes.wav"),
-    "num 4": ("うーん...", "depends.wav"),
-    "num 5": ("ちがうよ", "no.wav"),
-    "num 0": ("正解！！", "correct.wav")
-}
+# テンキーのリアクション (audio_manifest の点検でも使うので hotkeys.py に置いている)
+KEY_MAPPINGS = hotkeys.KEY_MAPPINGS
 
 IGNORE_TEXTS = ["考え中...", ""]
 
 def write_file(filename, content):
-    try:
-        path = os.path.join(BASE_DIR, filename)
-        with open(path, 'w', encoding='utf-8') as f:
-            f.write(content)
-    except Exception as e:
-        print(f"書き込みエラー: {e}")
+    global own_input_text
+    if filename == INPUT_TEXT_FILE:
+        own_input_text = content
+    event_type = EVENT_TYPES.get(filename)
+    if event_type and events is not None:
+        events.publish(event_type, content)
+        if OUTPUT_MODE == "socket": return
+    path = os.path.join(BASE_DIR, filename)
+    # 入力ファイルは LocalVocal も書き込むので、同じ内容でも必ず書く
+    output.write(path, content, force=(filename == INPUT_TEXT_FILE))
 
 # ★インジケーター（>）付きのテキスト書き出し（タイトルと区切り線を削除）
 def update_selection_display():
@@ -84,24 +186,38 @@ def update_selection_display():
     print(f"[位置変更] {current_selection_index + 1}番")
 
 # 操作キー用の関数
+def record(event_type, **fields):
+    if journal is not None:
+        journal.append(event_type, **fields)
+
 def next_selection():
     global current_selection_index
     current_selection_index = (current_selection_index + 1) % len(QUESTIONS)
+    record(session_journal.EVENT_SELECT, index=current_selection_index)
     update_selection_display()
 
 def prev_selection():
     global current_selection_index
     current_selection_index = (current_selection_index - 1) % len(QUESTIONS)
+    record(session_journal.EVENT_SELECT, index=current_selection_index)
     update_selection_display()
 
 def update_history_files(new_text=None):
-    global yes_history_list
+    # ★手がかりが1件増えたときは、ジャーナルに追記して変わった列だけ書き直す
     if new_text:
-        yes_history_list.append(f"・{new_text}")
-    left_content_list = yes_history_list[:MAX_HISTORY_LINES]
-    right_content_list = yes_history_list[MAX_HISTORY_LINES:]
-    write_file(HISTORY_FILE_LEFT, "\n".join(left_content_list))
-    write_file(HISTORY_FILE_RIGHT, "\n".join(right_content_list))
+        record(session_journal.EVENT_CLUE, text=new_text)
+        column = board.add(new_text)
+        write_file(HISTORY_FILES[column], board.text(column))
+        return
+    for column, filename in HISTORY_FILES.items():
+        write_file(filename, board.text(column))
+
+def new_game():
+    # 手がかりボードを空にして新しいゲームを始める (ジャーナルのこれより前は復元しない)
+    record(session_journal.EVENT_RESET)
+    board.clear()
+    update_history_files()
+    print("[新しいゲーム] 手がかりボードを空にしました")
 
 def load_json(filename):
     try:
@@ -112,52 +228,269 @@ def load_json(filename):
         print(f"★JSON読み込み失敗({filename}): {e}")
         return None
 
-def find_response(text, data):
-    text = text.lower()
-    text = re.sub(r'[^\w\s]', ' ', text)
-    text = re.sub(r'\s+', ' ', text).strip()
-    rules = []
-    for cat, items in data.get("rules", {}).items():
-        for k, v in items.items():
-            rules.append((k.lower(), v, cat))
-    rules.sort(key=lambda x: len(x[0]), reverse=True)
-    for k, v, cat in rules:
-        if k in text:
-            wav_file = data.get("response_map", {}).get(v)
-            if wav_file: return wav_file
-            if v.endswith(".wav"): return v
-            return DEFAULT_WAV
+def find_response(text, matcher, target=None):
+    # ★回答サービスがあればそちらで照合 (同じ知識データを常駐させたプロセスが答える)
+    # 返ってくるのは回答のキーだけなので、wav はこちらの response_map で引く
+    if service is not None and target:
+        try:
+            answer = service.answer(text, target, SIMILAR_MATCH)["answer"]
+            if answer is None:
+                return DEFAULT_WAV
+            return rule_engine.resolve_wav(matcher.response_map, answer, DEFAULT_WAV)
+        except answer_service.AnswerServiceError as e:
+            print(f"★{e} → 自分で照合します")
+    # ★正規化は text_processor に統一 (回答キャッシュの中で行う。ルール側のキーワードも同じ関数で正規化済み)
+    # ★ルールは起動時にコンパイル済み (最長一致のオートマトンで1回走査するだけ)
+    # 見つからなければ、つづり間違いを直してもう一度 (あいまい一致)
+    # 一度答えた質問は回答キャッシュから返す
+    rule = answers.lookup(matcher, text, SIMILAR_MATCH)
+    if rule:
+        k, v, cat = rule
+        return rule_engine.resolve_wav(matcher.response_map, v, DEFAULT_WAV)
     return DEFAULT_WAV
 
-def manual_reaction_trigger(log_text, wav_name):
-    global is_reacting
-    if is_reacting: return 
-    is_reacting = True
-    audio_dir = os.path.join(BASE_DIR, AUDIO_DIR_NAME)
-    full_path = os.path.normpath(os.path.join(audio_dir, wav_name))
-    try:
+def clear_output():
+    write_file(OUTPUT_PATH_FILE, "")
+    write_file(VIDEO_TRIGGER_FILE, "0")
+
+def audio_path(wav_name):
+    if audio is None:
+        return os.path.normpath(os.path.join(BASE_DIR, AUDIO_DIR_NAME, wav_name))
+    return audio.resolve(wav_name)
+
+def clip_seconds(wav_name, minimum=0.0):
+    # 再生開始から後片付けまでの秒数 = 実際の音声の長さ (WAVのヘッダーから起動時に読んだもの)
+    # 短い音声で無音の待ち時間を作らず、長い音声に次の質問が重ならないようにする
+    duration = audio.duration(wav_name) if audio is not None else None
+    if duration is None:
+        return max(minimum, CLEAR_DELAY)
+    return max(minimum, duration + CLIP_MARGIN)
+
+def thinking_delay(wav_name):
+    return THINKING_DELAYS.get(wav_name, THINKING_DELAY)
+
+def hotkey_timeline(wav_name, log_text=""):
+    full_path = audio_path(wav_name)
+
+    def think():
         write_file(INPUT_TEXT_FILE, "考え中...")
         write_file(THINKING_FILE, "1")
-        time.sleep(1.0) 
-        write_file(INPUT_TEXT_FILE, "") 
+
+    def play():
+        record(session_journal.EVENT_ANSWER, text=log_text, wav=wav_name, hotkey=True)
+        write_file(INPUT_TEXT_FILE, "")
         if wav_name == "correct.wav":
-             write_file(VIDEO_TRIGGER_FILE, "1")
+            write_file(VIDEO_TRIGGER_FILE, "1")
         write_file(OUTPUT_PATH_FILE, full_path)
-        time.sleep(0.2)
+
+    t_play = HOTKEY_THINKING_DELAY
+    return [
+        (0.0, "thinking", think),
+        (t_play, "playing", play),
+        (t_play + THINKING_HIDE_DELAY, "playing", lambda: write_file(THINKING_FILE, "0")),
+        (t_play + clip_seconds(wav_name, THINKING_HIDE_DELAY), "clearing", clear_output),
+    ]
+
+def transcript_timeline(text, matcher, trace, answer_since=None, target=None):
+    # ★答えは先に決めておく (後片付けの時刻を音声の長さに合わせるため)
+    wav = find_response(text, matcher, target)
+    trace.mark("match")
+    trace.info["wav"] = wav
+
+    def answer():
+        trace.mark("start")
+        record(session_journal.EVENT_ANSWER, text=text, wav=wav)
+        if wav:
+            full_path = audio_path(wav)
+            if wav in POSITIVE_WAVS:
+                update_history_files(text)
+            if wav == "correct.wav":
+                write_file(VIDEO_TRIGGER_FILE, "1")
+            write_file(OUTPUT_PATH_FILE, full_path)
         write_file(THINKING_FILE, "0")
-        time.sleep(1.0)
-        write_file(OUTPUT_PATH_FILE, "")
-        write_file(VIDEO_TRIGGER_FILE, "0")
-    finally:
-        is_reacting = False
+        output.flush()
+        trace.mark("write")
+
+    def clear():
+        clear_output()
+        output.flush()
+        trace.mark("clear")
+        trace.finish()
+
+    t_play = thinking_delay(wav)
+    if answer_since is not None:
+        # 先読みで答えが分かっていた分だけ「考え中」を短くする
+        t_play = max(MIN_THINKING_DELAY, t_play - (time.monotonic() - answer_since))
+    return [
+        (0.0, "thinking", lambda: write_file(THINKING_FILE, "1")),
+        (t_play, "playing", answer),
+        (t_play + clip_seconds(wav), "clearing", clear),
+    ]
+
+def print_stats():
+    latency.print_stats()
+    answers.print_stats()
+    pipeline.print_stats()
+    if intake is not None:
+        intake.print_stats()
+
+def manual_reaction_trigger(log_text, wav_name):
+    # keyboard のスレッドから呼ばれるので、イベントループ側のキューへ安全に渡す
+    # (再生中に押されても捨てずに、文字起こしより優先して次に流す)
+    pipeline.submit_threadsafe(reaction_pipeline.PRIORITY_HOTKEY, log_text, hotkey_timeline(wav_name, log_text))
+
+def offer_transcript(intake, text, trace, answer_since=None):
+    print(f"\n[質問検知] {text}")
+    intake.offer(question_intake.Question(
+        text, question_intake.SOURCE_TRANSCRIPT, priority=reaction_pipeline.PRIORITY_TRANSCRIPT,
+        trace=trace, answer_since=answer_since))
+
+async def watch_transcripts(watcher, input_path, intake, speculation=None):
+    # 先読みモードで、まだ確定していない最後の部分結果 (文, 計測)
+    partial = None
+
+    def commit():
+        text, trace = partial
+        _, since = speculation.confirm(text)
+        trace.info["speculative"] = since is not None
+        offer_transcript(intake, text, trace, since)
+
+    while True:
+        # 監視はブロッキングなので別スレッドで待つ
+        changed = await asyncio.to_thread(watcher.wait, FINAL_QUIET if partial else 0.5)
+        if not changed:
+            if partial:
+                # 書き込みが止まった = 話し終わった
+                commit()
+                partial = None
+            continue
+        try:
+            written_at = os.path.getmtime(input_path)
+        except OSError:
+            written_at = None
+        trace = latency.start("", written_at)
+        trace.mark("detect")
+        try:
+            with open(input_path, 'r', encoding='utf-8') as f:
+                text = f.read().strip()
+        except: continue
+        trace.mark("read")
+
+        if not text or text in IGNORE_TEXTS:
+            if partial:
+                if text == own_input_text:
+                    # 自分で書いた (ホットキーの「考え中...」など) だけ → 話していた分は言い終わったものとして答える
+                    commit()
+                else:
+                    # LocalVocal が部分結果を消した (言いかけてやめた) → 見込みも捨てる
+                    speculation.cancel()
+                partial = None
+            continue
+        trace.text = text
+
+        if speculation is None:
+            offer_transcript(intake, text, trace)
+            continue
+        if partial and not speculative.is_continuation(partial[0], text):
+            # 前の発話の続きではない = 前の発話はもう終わっている
+            commit()
+        speculation.update(text)
+        partial = (text, trace)
+
+async def feed_pipeline(intake, knowledge, game_item=None):
+    # ★質問は受付窓口から1問ずつ取り出し、前のリアクションが終わってから次を渡す
+    # (チャットが殺到しても、パイプラインに積み上がらず窓口側で間引かれる)
+    item = game_item
+    while True:
+        question = await intake.get()
+        await pipeline.queue.join()
+        trace = question.trace
+        if trace is None:
+            trace = latency.start(question.text)
+            trace.info["user"] = question.user
+        # 受け付けた時点のルールで最後まで答える (途中でリロードされても混ざらない)
+        matcher = knowledge.matcher
+        if knowledge.filename != item:
+            item = knowledge.filename
+            record(session_journal.EVENT_ITEM, name=item, default=JSON_FILE_NAME)
+        # 回答サービスには、こちらが読んでいるのと同じファイル (絶対パス) を指定する
+        target = answer_service.item_target(item, knowledge.base_dir, knowledge.store_path, knowledge.store)
+        if service is not None:
+            # 回答サービスへの問い合わせは待たされることがあるので、別スレッドで (ホットキーやソケットを止めない)
+            timeline = await asyncio.to_thread(
+                transcript_timeline, question.text, matcher, trace, question.answer_since, target)
+        else:
+            timeline = transcript_timeline(question.text, matcher, trace, question.answer_since, target)
+        pipeline.submit(question.priority, question.label(), timeline)
+
+async def run(watcher, input_path, knowledge, game_item=None):
+    global events, intake, OUTPUT_MODE
+    if events is not None:
+        try:
+            await events.start()
+        except OSError as e:
+            print(f"★イベント配信を始められません({EVENT_ADDRESS}): {e} → ファイル出力だけで続けます")
+            events = None
+            OUTPUT_MODE = "file"
+    intake = question_intake.QuestionIntake(
+        CHAT_MAX_PENDING, CHAT_USER_BURST, CHAT_USER_SECONDS, CHAT_DEDUP_WINDOW, CHAT_INTERVAL)
+    speculation = None
+    if STREAMING_MODE:
+        # 部分結果の照合も回答キャッシュを通す (同じ部分結果が何度も書かれるため)
+        speculation = speculative.Speculation(lambda text: answers.lookup(knowledge.matcher, text, SIMILAR_MATCH))
+    tasks = [
+        pipeline.run(),
+        watch_transcripts(watcher, input_path, intake, speculation),
+        feed_pipeline(intake, knowledge, game_item),
+    ]
+    if CHAT_SOCKET_ADDRESS is not None:
+        tasks.append(question_intake.serve_socket(intake, CHAT_SOCKET_ADDRESS))
+    if CHAT_LOG_FILE is not None:
+        tasks.append(question_intake.tail_chatlog(intake, os.path.join(BASE_DIR, CHAT_LOG_FILE)))
+    await asyncio.gather(*tasks)
 
 def main():
+    global events, latency, audio, journal, board, service, current_selection_index
     print("=== AI回答システム Ver 3.1 (シンプルリスト版) ===")
 
-    data = load_json(JSON_FILE_NAME)
-    if not data:
+    # ★知識データは裏で監視し、書き換えられたら再起動せずに差し替える
+    cache = None
+    if KNOWLEDGE_CACHE_DIR is not None:
+        cache = knowledge_cache.ArtifactCache(os.path.join(BASE_DIR, KNOWLEDGE_CACHE_DIR))
+    knowledge = knowledge_reload.KnowledgeReloader(
+        BASE_DIR, JSON_FILE_NAME, load_json, ACTIVE_ITEM_FILE, KNOWLEDGE_INDEX_FILE, cache=cache)
+    if not knowledge.load_initial():
         print("JSONファイルを確認してください。")
         return
+    if cache is not None:
+        print(f"[知識キャッシュ] 読み込み {cache.hits}件 / 作り直し {cache.misses}件")
+    if ANSWER_SERVICE_URL is not None:
+        service = answer_service.AnswerClient(ANSWER_SERVICE_URL)
+        print(f"[回答サービス] {ANSWER_SERVICE_URL} に照合を任せます")
+
+    # ★音声素材を点検 (知識データ・ホットキーから参照されているのに無いファイルを表示)
+    audio = audio_manifest.AudioManifest(os.path.join(BASE_DIR, AUDIO_DIR_NAME))
+    response_maps = [knowledge.matcher.response_map]
+    if knowledge.store is not None:
+        response_maps += [knowledge.store.get_data(i)["response_map"] for i in knowledge.store.item_ids()]
+    audio.report(audio_manifest.project_targets(response_maps))
+
+    # ★前回落ちたときの手がかりボードと選択位置をジャーナルから復元
+    journal = session_journal.SessionJournal(os.path.join(BASE_DIR, JOURNAL_FILE))
+    state = journal.load()
+    board = session_journal.ClueBoard(MAX_HISTORY_LINES, state.clues)
+    current_selection_index = state.selection % len(QUESTIONS)
+    if state.item and state.item != knowledge.filename:
+        if state.item_default == JSON_FILE_NAME:
+            # 前回、途中で切り替えた品物に戻す (読めなければ今の品物のまま)
+            knowledge.switch(state.item)
+        else:
+            # JSON_FILE_NAME を書き換えて起動し直したときは、設定の品物を使う
+            print(f"[ジャーナル] 設定の品物が変わったので {knowledge.filename} で始めます (前回は {state.item})")
+    if state.clues or state.answers:
+        print(f"[ジャーナル] 前回の続きから再開します (手がかり {len(state.clues)}件 / 回答 {state.answers}件)")
+    # 品物を戻してから監視を始める (監視スレッドと同時に切り替えない)
+    knowledge.start()
 
     # 初回起動時にテキストを書き出し
     update_selection_display()
@@ -166,59 +499,43 @@ def main():
     keyboard.add_hotkey("ctrl+up", prev_selection)
     keyboard.add_hotkey("ctrl+down", next_selection)
     print("[Ctrl + ↑] 上の項目へ / [Ctrl + ↓] 下の項目へ")
+    keyboard.add_hotkey("ctrl+r", knowledge.request_reload)
+    print("[Ctrl + R] 知識データを読み直す")
+    latency = latency_log.LatencyRecorder(os.path.join(BASE_DIR, LATENCY_LOG_FILE))
+    keyboard.add_hotkey("ctrl+l", print_stats)
+    print("[Ctrl + L] 応答時間・回答キャッシュ・リアクションの待ち・質問受付の集計を表示")
+    keyboard.add_hotkey("ctrl+n", lambda: pipeline.loop and pipeline.loop.call_soon_threadsafe(new_game))
+    print("[Ctrl + N] 新しいゲームを始める (手がかりボードを空にする)")
 
     for key_trigger, (text, wav) in KEY_MAPPINGS.items():
         keyboard.add_hotkey(key_trigger, lambda t=text, w=wav: manual_reaction_trigger(t, w))
     
     input_path = os.path.join(BASE_DIR, INPUT_TEXT_FILE)
-    audio_dir = os.path.join(BASE_DIR, AUDIO_DIR_NAME)
+
+    if OUTPUT_MODE != "file":
+        events = event_channel.EventChannel(EVENT_ADDRESS)
     
-    write_file(OUTPUT_PATH_FILE, "")
-    write_file(THINKING_FILE, "0")
-    write_file(VIDEO_TRIGGER_FILE, "0")
-    update_history_files()
+    with output.batch():
+        write_file(OUTPUT_PATH_FILE, "")
+        write_file(THINKING_FILE, "0")
+        write_file(VIDEO_TRIGGER_FILE, "0")
+        update_history_files()
 
-    last_time = os.path.getmtime(input_path) if os.path.exists(input_path) else 0.0
+    # ★LocalVocal の書き込み完了を待つ監視 (inotify が使えなければ従来のポーリング)
+    watcher = input_watcher.create_watcher(input_path)
 
     print("\n準備完了。")
 
     try:
-        while True:
-            time.sleep(0.1)
-            if not os.path.exists(input_path): continue
-            try:
-                mtime = os.path.getmtime(input_path)
-            except: continue
-
-            if mtime > last_time:
-                last_time = mtime
-                time.sleep(0.1) 
-                try:
-                    with open(input_path, 'r', encoding='utf-8') as f:
-                        text = f.read().strip()
-                except: continue
-
-                if not text or text in IGNORE_TEXTS: continue
-
-                print(f"\n[質問検知] {text}")
-                write_file(THINKING_FILE, "1")
-                time.sleep(1.5)
-                wav = find_response(text, data)
-                if wav:
-                    full_path = os.path.normpath(os.path.join(audio_dir, wav))
-                    if wav in POSITIVE_WAVS:
-                        update_history_files(text)
-                    if wav == "correct.wav":
-                        write_file(VIDEO_TRIGGER_FILE, "1")
-                    write_file(OUTPUT_PATH_FILE, full_path)
-                
-                write_file(THINKING_FILE, "0")
-                time.sleep(1.0)
-                write_file(OUTPUT_PATH_FILE, "")
-                write_file(VIDEO_TRIGGER_FILE, "0")
-
+        asyncio.run(run(watcher, input_path, knowledge, state.item))
     except KeyboardInterrupt:
         print("\n終了します。")
+    finally:
+        watcher.close()
+        knowledge.stop()
+        journal.close()
+        if events is not None:
+            events.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,79 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+class OutputWriter:
+    """
+    OBS 受け渡し用テキストファイルの書き込み係。
+    - 一時ファイルに書いてから os.replace で置き換えるので、OBS 側が途中の空ファイルを読むことがない
+    - 前回と同じ内容なら書き込まない
+    - batch() の中の書き込みはまとめて最後に1回だけ反映する
+    """
+
+    def __init__(self, replace_retries=5):
+        self.replace_retries = replace_retries
+        self._last = {}
+        self._pending = None
+        self._depth = 0
+        self._lock = threading.RLock()
+
+    def write(self, path, content, force=False):
+        """
+        path に content を書く。force=True なら前回と同じ内容でも書く
+        (LocalVocal など、他のプログラムも書き込むファイル用)。
+        """
+        with self._lock:
+            if self._pending is not None:
+                old = self._pending.get(path)
+                self._pending[path] = (content, force or (old is not None and old[1]))
+                return
+            self._write_now(path, content, force)
+
+    @contextmanager
+    def batch(self):
+        with self._lock:
+            if self._depth == 0:
+                self._pending = {}
+            self._depth += 1
+            try:
+                yield self
+            finally:
+                self._depth -= 1
+                if self._depth == 0:
+                    pending, self._pending = self._pending, None
+                    for path, (content, force) in pending.items():
+                        self._write_now(path, content, force)
+
+    def flush(self):
+        """batch() の途中でも、それまでの書き込みを今すぐ反映する。"""
+        with self._lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, {}
+            for path, (content, force) in pending.items():
+                self._write_now(path, content, force)
+
+    def _write_now(self, path, content, force):
+        if not force and self._last.get(path) == content:
+            return
+        tmp_path = path + ".tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(content)
+            self._replace(tmp_path, path)
+            self._last[path] = content
+        except Exception as e:
+            print(f"書き込みエラー: {e}")
+
+    def _replace(self, tmp_path, path):
+        # Windows では OBS が読んでいる瞬間だけ置き換えに失敗することがあるので少し粘る
+        for i in range(self.replace_retries):
+            try:
+                os.replace(tmp_path, path)
+                return
+            except PermissionError:
+                if i == self.replace_retries - 1:
+                    raise
+                time.sleep(0.005)
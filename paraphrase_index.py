@@ -0,0 +1,182 @@
+import heapq
+import math
+from array import array
+from bisect import bisect_left
+
+# 文字 n-gram の長さ
+NGRAM = 3
+# これ以上の割合のフレーズに出てくる n-gram は使わない ("is it" など、どの質問にもあって区別に役立たない)
+MAX_DF = 0.5
+# これ以上似ていれば答える (コサイン類似度 0〜1)
+# paraphrase_samples.jsonl の "tune" の行で決めた値 (python benchmark.py --similar-check)。
+# tune の無関係な質問の最高は "is it bigger than a car" → "is it bigger than you" の 0.74 なので、それより上にしている。
+# 決めるときに見ていない "holdout" の行でも誤答はないが、無関係な質問の最高は 0.74 で余裕は小さい
+DEFAULT_THRESHOLD = 0.75
+# しきい値つきの検索で読む転置リストの件数 / 最後まで数える候補の数の上限 (ParaphraseIndex.search)。
+# benchmark.py --realistic 30000 で、全件を数えた結果と違いが出ない範囲で小さくしている
+MAX_POSTINGS = 4000
+MAX_CANDIDATES = 300
+
+
+def features(text):
+    """
+    正規化済みの text の特徴 (n-gram → 出現回数)。
+    単語の先頭と末尾も区別できるように、単語ごとに前後へ空白を足してから切り出す。
+    """
+    counts = {}
+    for word in text.split():
+        padded = f" {word} "
+        if len(padded) <= NGRAM:
+            grams = [padded]
+        else:
+            grams = [padded[i:i + NGRAM] for i in range(len(padded) - NGRAM + 1)]
+        for gram in grams:
+            counts[gram] = counts.get(gram, 0) + 1
+    return counts
+
+
+class ParaphraseIndex:
+    """
+    言い換え用の類似検索 (文字 n-gram の TF-IDF + コサイン類似度)。
+    フレーズ全部の TF-IDF ベクトルを、n-gram → [(フレーズ番号, 重み)] の転置インデックス(疎行列)で持つ。
+    入力に出てくる n-gram の行だけを足し合わせるので、フレーズが数万件あっても全件とは比べない。
+    しきい値を渡すと、そこに届きうるフレーズ (候補) だけを数える (search の説明を参照)。
+    """
+
+    def __init__(self, phrases):
+        # phrases = [(正規化済みの文, 返すもの), ...]
+        self.values = [value for _, value in phrases]
+        n_docs = len(phrases)
+        docs = [features(text) for text, _ in phrases]
+
+        df = {}
+        for doc in docs:
+            for gram in doc:
+                df[gram] = df.get(gram, 0) + 1
+        max_df = max(1, int(n_docs * MAX_DF)) if n_docs > 10 else n_docs
+        self.idf = {gram: math.log((n_docs + 1) / (count + 1)) + 1.0
+                    for gram, count in df.items() if count <= max_df}
+        # 多すぎて使わない n-gram と、どのフレーズにもない n-gram の重み
+        self._common = {gram for gram, count in df.items() if count > max_df}
+        self._unseen_idf = math.log(n_docs + 1) + 1.0
+
+        # n-gram -> (フレーズ番号の配列, 重みの配列)
+        postings = {}
+        for doc_id, doc in enumerate(docs):
+            weights = self._weights(doc)
+            for gram, weight in weights.items():
+                entry = postings.get(gram)
+                if entry is None:
+                    entry = postings[gram] = (array("i"), array("d"))
+                entry[0].append(doc_id)
+                entry[1].append(weight)
+        self.postings = postings
+
+    def __len__(self):
+        return len(self.values)
+
+    def to_state(self):
+        return {
+            "values": self.values,
+            "idf": self.idf,
+            "common": sorted(self._common),
+            "unseen_idf": self._unseen_idf,
+            "postings": {gram: [ids.tolist(), weights.tolist()] for gram, (ids, weights) in self.postings.items()},
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        index = cls.__new__(cls)
+        index.values = state["values"]
+        index.idf = state["idf"]
+        index._common = set(state["common"])
+        index._unseen_idf = state["unseen_idf"]
+        index.postings = {gram: (array("i", ids), array("d", weights))
+                          for gram, (ids, weights) in state["postings"].items()}
+        return index
+
+    def _weights(self, counts):
+        """TF-IDF の重み (長さ1に正規化)。"""
+        idf = self.idf
+        weights = {}
+        unseen = 0.0
+        for gram, count in counts.items():
+            if gram in idf:
+                weights[gram] = (1.0 + math.log(count)) * idf[gram]
+            elif gram not in self._common:
+                # どのフレーズにもない n-gram も長さには数える (入力の知らない部分が多いほど似ていない)
+                unseen += ((1.0 + math.log(count)) * self._unseen_idf) ** 2
+        norm = math.sqrt(sum(w * w for w in weights.values()) + unseen)
+        if not norm:
+            return {}
+        return {gram: w / norm for gram, w in weights.items()}
+
+    def search(self, text, min_score=0.0):
+        """
+        一番似ているフレーズの (類似度, 番号)。何も似ていなければ (0.0, -1)。
+        min_score を渡すと、min_score に届きうるフレーズ (候補) だけを数える。
+          フレーズのベクトルは長さ1なので、入力の n-gram のうち R しか共有しないフレーズの類似度は
+          sqrt(R の重みの2乗和) 以下 (コーシー・シュワルツ)。そこで転置リストの短い n-gram から順に
+          足していき、残りの n-gram だけでは min_score に届かなくなったら、そこまでに出てきたフレーズを
+          候補にする。残りの n-gram は、まだ届きうる候補の分だけ二分探索で足す。
+          ただし読む転置リストは MAX_POSTINGS 件まで、候補は点数の高い MAX_CANDIDATES 件までにする
+          (本物の語彙で数万件あると、一番少ない n-gram でも何千件のフレーズに出てくるため)。
+        min_score を渡さなければ全件を数える (しきい値の点検用)。
+        """
+        query = self._weights(features(text))
+        postings = self.postings
+        if min_score <= 0.0:
+            scores = {}
+            for gram, q in query.items():
+                doc_ids, weights = postings[gram]
+                for doc_id, w in zip(doc_ids, weights):
+                    scores[doc_id] = scores.get(doc_id, 0.0) + q * w
+            return self._best(scores)
+
+        grams = sorted(query, key=lambda g: (len(postings[g][0]), g))
+        rest = sum(q * q for q in query.values())
+        limit = min_score * min_score
+        scores = {}
+        read = 0
+        i = 0
+        while i < len(grams) and rest >= limit and (read < MAX_POSTINGS or not scores):
+            gram = grams[i]
+            q = query[gram]
+            rest -= q * q
+            doc_ids, weights = postings[gram]
+            read += len(doc_ids)
+            for doc_id, w in zip(doc_ids, weights):
+                scores[doc_id] = scores.get(doc_id, 0.0) + q * w
+            i += 1
+        if len(scores) > MAX_CANDIDATES:
+            scores = dict(heapq.nlargest(MAX_CANDIDATES, scores.items(), key=lambda item: item[1]))
+
+        # 残りは重い n-gram から足す (残りの重みが早く減り、届かない候補を早く外せる)
+        for gram in sorted(grams[i:], key=lambda g: -query[g]):
+            floor = min_score - math.sqrt(max(rest, 0.0))
+            if floor > 0.0:
+                scores = {doc_id: s for doc_id, s in scores.items() if s >= floor}
+            if not scores:
+                break
+            q = query[gram]
+            rest -= q * q
+            # 転置リストはフレーズ番号の順に並んでいる
+            doc_ids, weights = postings[gram]
+            for doc_id in scores:
+                j = bisect_left(doc_ids, doc_id)
+                if j < len(doc_ids) and doc_ids[j] == doc_id:
+                    scores[doc_id] += q * weights[j]
+        return self._best(scores)
+
+    @staticmethod
+    def _best(scores):
+        if not scores:
+            return 0.0, -1
+        # 同じ点数なら先に登録されたフレーズ
+        doc_id = min(scores, key=lambda d: (-scores[d], d))
+        return scores[doc_id], doc_id
+
+    def lookup(self, text, threshold=DEFAULT_THRESHOLD):
+        """似ているフレーズの値。threshold に届かなければ None。"""
+        score, doc_id = self.search(text, threshold)
+        return self.values[doc_id] if doc_id != -1 and score >= threshold else None
@@ -0,0 +1,294 @@
+import asyncio
+import collections
+import json
+import os
+import sys
+import time
+
+import text_processor
+from reaction_pipeline import PRIORITY_CHAT
+
+SOURCE_TRANSCRIPT = "transcript"
+SOURCE_SOCKET = "socket"
+SOURCE_CHATLOG = "chatlog"
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 50506
+
+
+class Question:
+    def __init__(self, text, source, user=None, priority=PRIORITY_CHAT, trace=None, answer_since=None):
+        self.text = text
+        self.source = source
+        self.user = user
+        self.priority = priority
+        self.trace = trace
+        self.received_at = time.monotonic()
+        # 部分結果の時点で答えが分かっていた場合、その時刻 (speculative.Speculation)
+        self.answer_since = answer_since
+
+    def label(self):
+        return self.text if self.user is None else f"{self.user}: {self.text}"
+
+
+class QuestionIntake:
+    """
+    配信者の文字起こし・ローカルソケット・チャットログなど複数の入口から質問を受け付け、
+    回答パイプラインへ一定のペースで渡す窓口。
+    - 優先度ごとのキュー (配信者 > チャット)。全体で max_pending 件まで。
+      あふれたら一番優先度の低い古い質問から捨てる (チャットの連投で配信者の質問が消えない)
+    - チャットは user ごとに per_seconds 秒あたり user_burst 問まで (トークンバケツ)
+    - チャットは dedup_window 秒以内の同じ質問 (正規化して空白を除いたもの) を受け付けない
+    - チャットの質問は chat_interval 秒に1問までしか渡さない
+    clock は重複・回数制限の判定に使う時計 (動作確認で時間を進めるため差し替えられる)。
+    """
+
+    def __init__(self, max_pending=30, user_burst=3, per_seconds=30.0,
+                 dedup_window=20.0, chat_interval=2.0, clock=time.monotonic):
+        self.clock = clock
+        self.max_pending = max_pending
+        self.user_burst = user_burst
+        self.per_seconds = per_seconds
+        self.dedup_window = dedup_window
+        self.chat_interval = chat_interval
+
+        self._queues = {}
+        self._pending = 0
+        self._event = asyncio.Event()
+        # user -> [残りトークン, 最後に補充した時刻]
+        self._buckets = {}
+        # 正規化した質問 -> 最後に受け付けた時刻
+        self._recent = collections.OrderedDict()
+        self._last_chat = 0.0
+
+        self.counts = collections.Counter()
+
+    def __len__(self):
+        return self._pending
+
+    @staticmethod
+    def dedup_key(text):
+        return text_processor.normalize_text(text).replace(" ", "")
+
+    def offer(self, question):
+        """
+        質問を受け付ける (イベントループのスレッドから呼ぶ)。
+        受け付けたら True、重複・回数制限・あふれで捨てたら False。
+        """
+        now = self.clock()
+        key = self.dedup_key(question.text)
+        if not key:
+            return False
+        if question.user is not None:
+            if self._is_duplicate(key, now):
+                self.counts["duplicate"] += 1
+                return False
+            if not self._take_token(question.user, now):
+                self.counts["rate_limited"] += 1
+                return False
+        self._remember(key, now)
+
+        if self._pending >= self.max_pending and not self._evict(question.priority):
+            self.counts["dropped"] += 1
+            return False
+        self._queues.setdefault(question.priority, collections.deque()).append(question)
+        self._pending += 1
+        self.counts["accepted"] += 1
+        self._event.set()
+        return True
+
+    def _is_duplicate(self, key, now):
+        seen = self._recent.get(key)
+        return seen is not None and now - seen < self.dedup_window
+
+    def _remember(self, key, now):
+        self._recent[key] = now
+        self._recent.move_to_end(key)
+        # 古いものから忘れる
+        while self._recent:
+            oldest_key, seen = next(iter(self._recent.items()))
+            if now - seen < self.dedup_window:
+                break
+            del self._recent[oldest_key]
+
+    def _take_token(self, user, now):
+        bucket = self._buckets.get(user)
+        if bucket is None:
+            bucket = self._buckets[user] = [float(self.user_burst), now]
+        tokens = min(self.user_burst, bucket[0] + (now - bucket[1]) * self.user_burst / self.per_seconds)
+        bucket[1] = now
+        if tokens < 1.0:
+            bucket[0] = tokens
+            return False
+        bucket[0] = tokens - 1.0
+        return True
+
+    def _evict(self, priority):
+        """priority 以下の大事さの質問を1つ捨てて場所を空ける。空けられなければ False。"""
+        for p in sorted(self._queues, reverse=True):
+            if p < priority:
+                break
+            queue = self._queues[p]
+            if queue:
+                queue.popleft()
+                self._pending -= 1
+                self.counts["dropped"] += 1
+                return True
+        return False
+
+    async def get(self):
+        """次に答える質問を待って返す。チャットの質問は chat_interval 秒の間隔をあける。"""
+        while True:
+            for p in sorted(self._queues):
+                queue = self._queues[p]
+                if not queue:
+                    continue
+                if p >= PRIORITY_CHAT:
+                    wait = self._last_chat + self.chat_interval - time.monotonic()
+                    if wait > 0:
+                        # 待っている間に配信者の質問が来たら先に渡す
+                        self._event.clear()
+                        try:
+                            await asyncio.wait_for(self._event.wait(), wait)
+                        except asyncio.TimeoutError:
+                            pass
+                        break
+                    self._last_chat = time.monotonic()
+                self._pending -= 1
+                return queue.popleft()
+            else:
+                self._event.clear()
+                await self._event.wait()
+
+    def stats(self):
+        return {"pending": self._pending, **self.counts}
+
+    def print_stats(self):
+        c = self.counts
+        print(f"[質問受付] 待ち {self._pending}件 / 受付 {c['accepted']} / 重複 {c['duplicate']} / "
+              f"回数制限 {c['rate_limited']} / あふれ {c['dropped']} / 読めない行 {c['invalid']}")
+
+
+# --- 入口 ---
+
+def parse_line(line):
+    """
+    1行1JSON ({"user": ..., "text": ...}) か、ただの文字列。(user, text) を返す。
+    user は文字列か数値だけ使う (それ以外は anonymous)。text が文字列でなければ空文字。
+    """
+    line = line.strip()
+    if line.startswith("{"):
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        if isinstance(row, dict):
+            user = row.get("user")
+            if isinstance(user, bool) or not isinstance(user, (str, int)):
+                user = ""
+            text = row.get("text")
+            if not isinstance(text, str):
+                text = ""
+            return str(user).strip() or "anonymous", text.strip()
+    return "anonymous", line
+
+
+def offer_line(intake, line, source):
+    """
+    外から来た1行を質問として受け付ける。受け付けたら True。
+    おかしな行は捨てて数えるだけにする (1行のせいで入口や main.py を止めない)。
+    """
+    try:
+        user, text = parse_line(line)
+        return bool(text) and intake.offer(Question(text, source, user))
+    except Exception as e:
+        intake.counts["invalid"] += 1
+        print(f"★読めない質問を捨てました({source}): {e}")
+        return False
+
+
+async def serve_socket(intake, address=(DEFAULT_HOST, DEFAULT_PORT)):
+    """
+    ローカルソケットで質問を受け付ける (チャット連携ボットなど用)。
+    1行1問で送ると、1行ごとに {"accepted": true/false} を返す。
+    """
+    async def on_connect(reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                accepted = offer_line(intake, line.decode("utf-8", errors="replace"), SOURCE_SOCKET)
+                writer.write(json.dumps({"accepted": accepted}).encode("utf-8") + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    try:
+        if isinstance(address, str):
+            server = await asyncio.start_unix_server(on_connect, path=address)
+        else:
+            server = await asyncio.start_server(on_connect, *address)
+    except OSError as e:
+        # ポートが使われているときなど。ほかの入口 (文字起こし・チャットログ) はそのまま動かす
+        print(f"★質問受付を始められません({address}): {e} → ソケットからの質問なしで続けます")
+        return
+    print(f"[質問受付] {address} で待ち受け中")
+    async with server:
+        await server.serve_forever()
+
+
+async def tail_chatlog(intake, path, interval=0.5):
+    """
+    チャットログ (1行1JSON) を tail -f のように読み、追記された質問を受け付ける。
+    起動前に書かれていた分は読まない。ファイルが作り直されたら先頭から読み直す。
+    """
+    position = None
+    buffer = b""
+    while True:
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = None
+        if size is None:
+            position = 0
+        elif position is None:
+            position = size
+        elif size < position:
+            position = 0
+            buffer = b""
+        if size is not None and size > position:
+            # 書きかけの行 (改行がまだない分) は次回に回す
+            with open(path, "rb") as f:
+                f.seek(position)
+                buffer += f.read(size - position)
+            position = size
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                offer_line(intake, line.decode("utf-8", errors="replace"), SOURCE_CHATLOG)
+        await asyncio.sleep(interval)
+
+
+async def _send(address, lines):
+    if isinstance(address, str):
+        reader, writer = await asyncio.open_unix_connection(address)
+    else:
+        reader, writer = await asyncio.open_connection(*address)
+    try:
+        for line in lines:
+            writer.write(line.encode("utf-8") + b"\n")
+            await writer.drain()
+            print((await reader.readline()).decode("utf-8").strip())
+    finally:
+        writer.close()
+
+
+if __name__ == "__main__":
+    # 使い方: python question_intake.py [ポート番号 または ソケットのパス] < questions.txt
+    # (標準入力の1行1問を main.py の質問受付に送る動作確認用)
+    target = (DEFAULT_HOST, DEFAULT_PORT)
+    if len(sys.argv) > 1:
+        target = (DEFAULT_HOST, int(sys.argv[1])) if sys.argv[1].isdigit() else sys.argv[1]
+    asyncio.run(_send(target, [line.rstrip("\n") for line in sys.stdin if line.strip()]))
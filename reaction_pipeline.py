@@ -0,0 +1,108 @@
+import asyncio
+import itertools
+import time
+
+# 優先度 (数字が小さいほど先に処理する)
+PRIORITY_HOTKEY = 0
+PRIORITY_TRANSCRIPT = 1
+PRIORITY_CHAT = 2
+
+STATE_IDLE = "idle"
+
+
+class ReactionPipeline:
+    """
+    OBS へのリアクション(考え中 → 音声 → 後片付け)を順番に1つずつ流す asyncio の状態機械。
+    リアクションは優先度付きキューに積まれ (ホットキー > 文字起こし > チャット)、
+    各ステップは time.sleep ではなく loop.call_at のタイマーで実行される。
+    """
+
+    def __init__(self, step_context=None):
+        # 同時刻のステップをまとめて包むコンテキスト (ファイル書き込みの一括反映など)
+        self.step_context = step_context
+        self.queue = asyncio.PriorityQueue()
+        self.loop = None
+        self.state = STATE_IDLE
+        self._seq = itertools.count()
+
+        # 混雑状況の確認用
+        self.processed = 0
+        self.last_wait = 0.0
+        self.max_wait = 0.0
+
+    def submit(self, priority, label, timeline):
+        """
+        リアクションをキューに積む (イベントループのスレッドから呼ぶ)。
+        timeline は [(開始からの秒数, 状態名, 関数), ...] のリスト。
+        """
+        self.queue.put_nowait((priority, next(self._seq), time.monotonic(), label, timeline))
+
+    def submit_threadsafe(self, priority, label, timeline):
+        """keyboard のコールバックなど、別スレッドから積むとき用。"""
+        if self.loop is None:
+            print("[リアクション] まだ準備中のため無視しました")
+            return
+        self.loop.call_soon_threadsafe(self.submit, priority, label, timeline)
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "queue_depth": self.queue.qsize(),
+            "processed": self.processed,
+            "last_wait": self.last_wait,
+            "max_wait": self.max_wait,
+        }
+
+    def print_stats(self):
+        s = self.stats()
+        print(f"[リアクション] 状態 {s['state']} / 待ち {s['queue_depth']}件 / 処理 {s['processed']}件 / "
+              f"待ち時間 直近 {s['last_wait'] * 1000:.0f}ms・最大 {s['max_wait'] * 1000:.0f}ms")
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        while True:
+            priority, _, queued_at, label, timeline = await self.queue.get()
+            wait = time.monotonic() - queued_at
+            self.last_wait = wait
+            self.max_wait = max(self.max_wait, wait)
+            print(f"[リアクション] {label} (待ち時間 {wait:.2f}秒 / 残り {self.queue.qsize()}件)")
+            try:
+                await self._play(timeline)
+            finally:
+                self.state = STATE_IDLE
+                self.processed += 1
+                self.queue.task_done()
+
+    async def _play(self, timeline):
+        if not timeline:
+            return
+        done = self.loop.create_future()
+        start = self.loop.time()
+
+        # 同じ時刻のステップは1つのタイマーにまとめる (タイマー同士の実行順は保証されないため)
+        groups = {}
+        for offset, state, func in timeline:
+            groups.setdefault(offset, []).append((state, func))
+        offsets = sorted(groups)
+
+        for offset in offsets:
+            is_last = offset == offsets[-1]
+            self.loop.call_at(start + offset, self._run_steps, groups[offset], done if is_last else None)
+        await done
+
+    def _run_steps(self, steps, done):
+        if self.step_context is not None:
+            with self.step_context():
+                self._call_steps(steps)
+        else:
+            self._call_steps(steps)
+        if done is not None and not done.done():
+            done.set_result(None)
+
+    def _call_steps(self, steps):
+        for state, func in steps:
+            self.state = state
+            try:
+                func()
+            except Exception as e:
+                print(f"リアクション実行エラー: {e}")
@@ -0,0 +1,213 @@
+import hashlib
+import json
+from collections import deque
+
+import fuzzy_index
+import paraphrase_index
+import text_processor
+
+# 答えが見つからない・対応する音声がないときの wav
+DEFAULT_WAV = "none.wav"
+
+
+class RuleMatcher:
+    """
+    知識データ(microwave_data.json 等)の rules を一度だけコンパイルした
+    Aho-Corasick オートマトン。
+    入力文を1回なめるだけで、含まれるキーワードのうち「一番長いもの」を返す。
+    (同じ長さなら JSON 上で先に書かれたルールを優先 = 従来の長い順ソートと同じ結果)
+    """
+
+    def __init__(self, data):
+        data = data or {}
+        self.response_map = data.get("response_map", {})
+        # rules[i] = (keyword, answer_key, category)  ※ keyword は表示用に元の表記のまま
+        self.rules = []
+        # 照合に使う正規化済みキーワード (text_processor.normalize_text)
+        self._keys = []
+
+        # ノード0が根。goto[n] は 文字 -> 次ノード
+        self._goto = [{}]
+        self._fail = [0]
+        # そのノードで終わるルール番号 (なければ -1)
+        self._terminal = [-1]
+
+        for cat, items in data.get("rules", {}).items():
+            for k, v in items.items():
+                # キーワード側の正規化はここで1回だけ
+                key = text_processor.normalize_text(k)
+                if not key:
+                    continue
+                self._add(key, (k.lower(), v, cat))
+
+        self._build()
+        # ルールと回答の中身のハッシュ (回答キャッシュのキーに使う。中身が同じなら同じ値)
+        content = json.dumps([self.rules, self.response_map], ensure_ascii=False, sort_keys=True)
+        self.digest = hashlib.sha1(content.encode("utf-8")).hexdigest()[:12]
+        # 完全一致で見つからなかったとき用のあいまい検索 (聞き間違い・つづり間違い対策)
+        self._fuzzy = fuzzy_index.FuzzyIndex(self._keys)
+        # 言い換え用の類似検索 (コンパイル時に作っておき、質問の途中で作らない)
+        self._similar = paraphrase_index.ParaphraseIndex([(key, i) for i, key in enumerate(self._keys)])
+
+    def __len__(self):
+        return len(self.rules)
+
+    def to_state(self):
+        """コンパイル結果を JSON にできる形 (dict・list・文字列・数値だけ) で返す。knowledge_cache の保存用。"""
+        return {
+            "response_map": self.response_map,
+            "rules": self.rules,
+            "keys": self._keys,
+            "goto": self._goto,
+            "fail": self._fail,
+            "best": self._best,
+            "digest": self.digest,
+            "fuzzy": self._fuzzy.to_state(),
+            "similar": self._similar.to_state(),
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        """to_state() の結果から、コンパイルし直さずに RuleMatcher を組み立てる。"""
+        matcher = cls.__new__(cls)
+        matcher.response_map = state["response_map"]
+        matcher.rules = [tuple(rule) for rule in state["rules"]]
+        matcher._keys = state["keys"]
+        # JSON のキーは文字列なので、goto の値 (ノード番号) はそのまま使える
+        matcher._goto = state["goto"]
+        matcher._fail = state["fail"]
+        matcher._best = state["best"]
+        matcher.digest = state["digest"]
+        matcher._fuzzy = fuzzy_index.FuzzyIndex.from_state(state["fuzzy"])
+        matcher._similar = paraphrase_index.ParaphraseIndex.from_state(state["similar"])
+        return matcher
+
+    def _add(self, keyword, rule):
+        node = 0
+        for ch in keyword:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._terminal.append(-1)
+            node = nxt
+        # 重複キーワードは最初に登録されたものを優先
+        if self._terminal[node] == -1:
+            self._terminal[node] = len(self.rules)
+            self.rules.append(rule)
+            self._keys.append(keyword)
+
+    def _better(self, a, b):
+        # a, b はルール番号。長いキーワード > 先に登録されたルール の順で優先
+        if a == -1:
+            return b
+        if b == -1:
+            return a
+        la, lb = len(self._keys[a]), len(self._keys[b])
+        if la != lb:
+            return a if la > lb else b
+        return min(a, b)
+
+    def _build(self):
+        # 幅優先で failure リンクを張り、各ノードの「最良の出力」を確定させる
+        self._best = list(self._terminal)
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(ch, 0)
+                # 自分自身で終わるキーワードは接尾辞側より必ず長い
+                if self._terminal[nxt] == -1:
+                    self._best[nxt] = self._best[self._fail[nxt]]
+                queue.append(nxt)
+
+    def match(self, text):
+        """
+        正規化済み (text_processor.normalize_text) の text を走査し、最長一致したルール
+        (keyword, answer_key, category) を返す。見つからなければ None。
+        """
+        goto, fail, best = self._goto, self._fail, self._best
+        node = 0
+        found = -1
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if best[node] != -1:
+                found = self._better(found, best[node])
+        return self.rules[found] if found != -1 else None
+
+    def match_fuzzy(self, text):
+        """
+        match() で見つからなかったときの第2段階。
+        キーワードに出てくる単語に近い単語 ("convinience" → "convenience" など) を直してから、
+        もう一度オートマトンに通す。
+        """
+        corrected = self._fuzzy.correct(text)
+        return self.match(corrected) if corrected else None
+
+    def match_similar(self, text, threshold=paraphrase_index.DEFAULT_THRESHOLD):
+        """
+        第3段階。キーワードが文中に見つからなくても、キーワード(質問文形式の品物なら質問まるごと)と
+        文字 n-gram の TF-IDF で十分似ていれば、そのルールを返す ("can you eat this" → "can you eat it?")。
+        """
+        found = self._similar.lookup(text, threshold)
+        return self.rules[found] if found is not None else None
+
+    def similar_score(self, text):
+        """言い換え検索で一番似ているルールと類似度 (類似度, ルール)。しきい値の調整用。"""
+        score, doc_id = self._similar.search(text)
+        return score, (self.rules[self._similar.values[doc_id]] if doc_id != -1 else None)
+
+    def lookup(self, text, similar=False):
+        """
+        完全一致 → あいまい一致 の順に探す。similar=True なら最後に言い換え(類似検索)も試す。
+        言い換えは「分からない」と答えるべき質問にも答えてしまうことがあるので、使う側が選ぶ。
+        """
+        rule = self.match(text) or self.match_fuzzy(text)
+        if rule is None and similar:
+            rule = self.match_similar(text)
+        return rule
+
+
+def validate_data(data):
+    """
+    知識データの形をチェックする。おかしければ ValueError。
+    (ホットリロード時に、壊れたJSONで動作中のルールを上書きしないため)
+    """
+    if not isinstance(data, dict):
+        raise ValueError("知識データが dict ではありません")
+    rules = data.get("rules")
+    if not isinstance(rules, dict) or not rules:
+        raise ValueError("rules がありません")
+    for cat, items in rules.items():
+        if not isinstance(items, dict):
+            raise ValueError(f"rules.{cat} が dict ではありません")
+        for k, v in items.items():
+            if not isinstance(v, str):
+                raise ValueError(f"rules.{cat}.{k} の回答が文字列ではありません")
+    if not isinstance(data.get("response_map", {}), dict):
+        raise ValueError("response_map が dict ではありません")
+
+
+def resolve_wav(response_map, answer_key, default_wav=DEFAULT_WAV):
+    """
+    回答 (yes 等) → 再生する wav 名。main.py・batch_answer.py・answer_service.py で共通。
+    response_map にあればその値、回答そのものが .wav ならそれ、どちらでもなければ default_wav。
+    """
+    wav = response_map.get(answer_key)
+    if wav:
+        return wav
+    if answer_key.endswith(".wav"):
+        return answer_key
+    return default_wav
+
+
+def compile_rules(data):
+    """知識データ(dict)から RuleMatcher を作る。起動時に1回だけ呼ぶ想定。"""
+    return RuleMatcher(data)
@@ -0,0 +1,155 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+
+EVENT_ANSWER = "answer"   # 質問に答えた (text, wav)
+EVENT_CLUE = "clue"       # 手がかり(YES系の質問)が増えた (text)
+EVENT_SELECT = "select"   # 質問テンプレートの選択位置が変わった (index)
+EVENT_ITEM = "item"       # 品物(知識データ)が切り替わった (name, そのときの設定の品物 default)
+EVENT_RESET = "reset"     # 新しいゲームを始めた (これより前の出来事は復元しない)
+
+
+class GameState:
+    """ジャーナルを頭から流し直して作る、今のゲームの状態。"""
+
+    def __init__(self):
+        self.clues = []
+        self.selection = 0
+        self.item = None
+        # item を記録したときの設定の品物 (JSON_FILE_NAME)。設定が変わっていたら item は戻さない
+        self.item_default = None
+        self.answers = 0
+
+    def apply(self, event):
+        event_type = event.get("type")
+        if event_type == EVENT_CLUE:
+            self.clues.append(event["text"])
+        elif event_type == EVENT_SELECT:
+            self.selection = event["index"]
+        elif event_type == EVENT_ITEM:
+            self.item = event["name"]
+            self.item_default = event.get("default")
+        elif event_type == EVENT_ANSWER:
+            self.answers += 1
+        elif event_type == EVENT_RESET:
+            item, item_default = self.item, self.item_default
+            self.__init__()
+            # 品物は新しいゲームでもそのまま
+            self.item, self.item_default = item, item_default
+
+
+class SessionJournal:
+    """
+    配信中のゲームの出来事を1行1JSONで追記していくだけのジャーナル。
+    書き換えはしないので、途中で落ちても最後の1行が欠けるだけで済み、
+    再起動時に load() で流し直せば手がかりボードや選択位置が元に戻る。
+    """
+
+    def __init__(self, path, compact_lines=5000):
+        self.path = path
+        # 起動時、これより長いジャーナルは最後の reset 以降だけに詰め直す
+        self.compact_lines = compact_lines
+        self._lock = threading.Lock()
+        self._file = None
+
+    def load(self):
+        """ジャーナルを流し直して GameState を返す。ファイルがなければ空の状態。"""
+        state = GameState()
+        events = []
+        torn = False
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    # 改行で終わっていない最後の行 = 書いている途中で落ちた
+                    torn = not line.endswith("\n")
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        # 落ちたときの書きかけの行
+                        continue
+                    events.append(event)
+        except FileNotFoundError:
+            return state
+        last_reset = 0
+        for i, event in enumerate(events):
+            state.apply(event)
+            if event.get("type") == EVENT_RESET:
+                last_reset = i
+        if len(events) > self.compact_lines and last_reset > 0:
+            kept = events[last_reset:]
+            if state.item:
+                # 品物はリセットをまたいで使うので、リセットより前の切り替えも残す
+                kept.insert(0, {"type": EVENT_ITEM, "name": state.item, "default": state.item_default})
+            self._compact(kept)
+        elif torn:
+            # 書きかけの行を残したまま追記すると、次の出来事がその行につながって一緒に読めなくなる
+            self._truncate_tail()
+        return state
+
+    def _truncate_tail(self):
+        """最後の改行より後ろ (書きかけの行) を切り捨てる。"""
+        with open(self.path, "rb+") as f:
+            data = f.read()
+            f.truncate(data.rfind(b"\n") + 1)
+
+    def _compact(self, events):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for event in events:
+                f.write(json.dumps(event, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self.path)
+
+    def append(self, event_type, **fields):
+        """出来事を1行追記する。どのスレッドから呼んでもよい。"""
+        line = json.dumps({"type": event_type, "time": time.time(), **fields}, ensure_ascii=False) + "\n"
+        with self._lock:
+            try:
+                if self._file is None:
+                    self._file = open(self.path, "a", encoding="utf-8")
+                self._file.write(line)
+                # プロセスが落ちても残るように、毎回 OS に渡しておく
+                self._file.flush()
+            except OSError as e:
+                print(f"ジャーナル書き込みエラー: {e}")
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class ClueBoard:
+    """
+    OBS に出す手がかりボード (左右2列)。左は最初の max_lines 件、右はその後の直近 max_lines 件。
+    1件増えるたびに、変わった列の文字列だけを作り直す。
+    """
+
+    def __init__(self, max_lines, clues=()):
+        self.max_lines = max_lines
+        self.left = []
+        self.right = deque(maxlen=max_lines)
+        self._text = {"left": "", "right": ""}
+        for clue in clues:
+            self.add(clue)
+
+    def add(self, clue):
+        """手がかりを1件足し、変わった列の名前 ("left" / "right") を返す。"""
+        line = f"・{clue}"
+        if len(self.left) < self.max_lines:
+            self.left.append(line)
+            self._text["left"] = line if len(self.left) == 1 else self._text["left"] + "\n" + line
+            return "left"
+        self.right.append(line)
+        self._text["right"] = "\n".join(self.right)
+        return "right"
+
+    def text(self, column):
+        return self._text[column]
+
+    def clear(self):
+        self.left = []
+        self.right.clear()
+        self._text = {"left": "", "right": ""}
@@ -0,0 +1,64 @@
+import time
+
+
+class Speculation:
+    """
+    話している途中の文字起こし(部分結果)で先に照合しておく「見込み回答」。
+    - update(): 部分結果が届くたびに照合し、答え(ルール)が変わったら見込みを付け替える
+    - confirm(): 最終結果でもう一度照合し、見込みと同じルールなら「いつから分かっていたか」を返す
+      違うルールなら見込みは捨てる (最終結果の答えを使う)
+    lookup は 文 → ルール (なければ None) の関数。
+    """
+
+    def __init__(self, lookup):
+        self.lookup = lookup
+        self.confirmed = 0
+        self.cancelled = 0
+        self.reset()
+
+    def reset(self):
+        self.text = ""
+        self.rule = None
+        self.since = None
+
+    def update(self, text):
+        rule = self.lookup(text)
+        if rule is not None and rule != self.rule:
+            if self.rule is not None:
+                # 言葉が続いて答えが変わった → 前の見込みは取り消し
+                self.cancelled += 1
+            self.text = text
+            self.rule = rule
+            self.since = time.monotonic()
+        return rule
+
+    def confirm(self, final_text):
+        """
+        最終結果を照合し、(ルール, 見込みが立った時刻) を返す。
+        見込みが外れた・なかったときの時刻は None。どちらの場合も見込みはリセットする。
+        """
+        rule = self.lookup(final_text)
+        since = None
+        if self.rule is not None:
+            if rule == self.rule:
+                since = self.since
+                self.confirmed += 1
+            else:
+                self.cancelled += 1
+        self.reset()
+        return rule, since
+
+    def cancel(self):
+        if self.rule is not None:
+            self.cancelled += 1
+        self.reset()
+
+
+def is_continuation(previous, text):
+    """text が previous の続き (同じ発話の部分結果が伸びたもの・言い直し) か。"""
+    if not previous:
+        return False
+    a, b = previous.lower().split(), text.lower().split()
+    # 最後の単語は途中で認識が変わることがあるので、それより前が同じなら続きとみなす
+    head = a[:-1]
+    return b[:len(head)] == head
@@ -1,26 +1,47 @@
+import re
 import string
+import unicodedata
+
+# 記号は空白に置き換える (英語の句読点と日本語の記号)
+_JAPANESE_PUNCTUATION = '。、？！「」（）『』【】・…〜～：；'
+# カタカナ → ひらがな (ァ〜ヶ を ぁ〜ゖ に寄せる。"レンジ" と "れんじ" を同じ扱いにする)
+_KANA_FOLD = {code: code - 0x60 for code in range(0x30A1, 0x30F7)}
+
+# ★変換表と正規表現はモジュール読み込み時に1回だけ作る
+_TRANSLATOR = str.maketrans({
+    **{ch: ' ' for ch in string.punctuation + _JAPANESE_PUNCTUATION},
+    **{chr(k): chr(v) for k, v in _KANA_FOLD.items()},
+})
+_NON_WORD = re.compile(r'[^\w\s]')
+
 
 def normalize_text(text: str) -> str:
     """
     Whisperの出力とJSONキーを比較するために、文字列を正規化する。
-    小文字化、不要な空白除去、句読点除去を行う。
+    main.py / app.py / rule_engine (キーワード側) で共通。
+    1. 全角・半角の統一 (NFKC: "ＡＢＣ１２３" → "abc123"、半角カナ → 全角カナ)
+    2. 小文字化、カタカナ → ひらがな
+    3. 記号を空白に置き換え、連続する空白を一つにまとめる
     """
-    # 1. 小文字化 (大文字・小文字の揺れを吸収)
-    normalized_text = text.lower()
-    
-    # 2. 句読点の除去 (マッチングの厳しさを緩和)
-    # 英語の句読点と日本語の記号を除去対象とする
-    punctuation_to_remove = string.punctuation
-    japanese_punctuation = '。、？！「」（）' 
-    
-    # 除去対象の文字を空文字に置き換えるための翻訳テーブルを作成
-    translator = str.maketrans('', '', punctuation_to_remove + japanese_punctuation)
-    normalized_text = normalized_text.translate(translator)
-    
-    # 3. 前後の空白除去
-    normalized_text = normalized_text.strip()
-    
-    # 4. 連続する空白を一つにまとめる ('  ' -> ' ')
-    normalized_text = ' '.join(normalized_text.split())
+    if not text:
+        return ""
+    normalized_text = unicodedata.normalize('NFKC', text)
+    normalized_text = normalized_text.lower().translate(_TRANSLATOR)
+    # 変換表にない記号 (絵文字など) も空白にする
+    normalized_text = _NON_WORD.sub(' ', normalized_text)
+    return ' '.join(normalized_text.split())
 
-    return normalized_text
\ No newline at end of file
+
+def normalize_batch(texts):
+    """
+    大量の文 (コーパス・チャットログ等) をまとめて正規化する。
+    同じ文は1回だけ処理して使い回す。入力と同じ順番のリストを返す。
+    """
+    cache = {}
+    result = []
+    for text in texts:
+        normalized = cache.get(text)
+        if normalized is None:
+            normalized = cache[text] = normalize_text(text)
+        result.append(normalized)
+    return result